@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+""" Benchmarks for compare_files.py and diff.py on synthetic inputs.
+
+* compare: builds dir1/dir2 trees with configurable file count, size distribution, depth,
+           percentage of identical files and duplicate basenames, then times end-to-end
+           compare_files.py runs and its discovery/index/lookup/compare/diff phases.
+* diff:    times diff.diff() on generated large text files with a controlled edit density.
+* startup: import time of pyutils, diff and compare_files from `python -X importtime`,
+           checked against --startup_budget as these scripts run thousands of times from build scripts.
+* includes: checks that compare_files.iter_files() selects the same files as Path.rglob() for
+           the rglob_includes patterns, as the walk replaced rglob.
+
+Results are written as json and can be checked against a stored baseline:
+    bench_compare.py --output base.json
+    bench_compare.py --baseline base.json --threshold 0.2
+exits with 1 when any timing regressed by more than the threshold.
+"""
+
+import argparse, json, logging, math, os, random, subprocess, sys, tempfile, time
+from pathlib import Path
+
+import pyutils, diff
+
+script_dir = Path(__file__).resolve().parent
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files',       '-f',    help='# of files in dir1',  type=int, default=2000)
+    parser.add_argument('--size_min',    '-smin', help='Min file size in bytes',  type=int, default=100)
+    parser.add_argument('--size_max',    '-smax', help='Max file size in bytes, sizes are log-uniform between min and max',  type=int, default=100000)
+    parser.add_argument('--depth',       '-dp',   help='Max dir depth of the trees',  type=int, default=4)
+    parser.add_argument('--identical',   '-id',   help='Percentage of identical files',  type=float, default=90)
+    parser.add_argument('--dup_names',   '-dn',   help='Percentage of dir2 files duplicating a basename',  type=float, default=5)
+    parser.add_argument('--diff_lines',  '-dl',   help='# of lines of the generated diff inputs',  type=int, default=200000)
+    parser.add_argument('--edit_density','-ed',   help='Fraction of edited lines in the diff inputs',  type=float, default=0.001)
+    parser.add_argument('--compare_args','-ca',   help='Extra compare_files.py args, e.g. "--jobs 4 --diff unified"',  type=str, default='')
+    parser.add_argument('--repeat',      '-r',    help='Repeat each timing and keep the fastest',  type=int, default=3)
+    parser.add_argument('--seed',        '-sd',   help='Random seed of the generated inputs',  type=int, default=1)
+    parser.add_argument('--skip',        '-sk',   help='Skip benchmarks',  choices=['compare', 'diff', 'startup', 'includes'], action='append', default=[])
+    parser.add_argument('--startup_budget', '-sb', help='Max import time of each module in ms, exits with 1 when exceeded',  type=float, default=100)
+    parser.add_argument('--output',      '-o',    help='Write results to this json file',  type=str)
+    parser.add_argument('--baseline',    '-b',    help='Compare results against this json file',  type=str)
+    parser.add_argument('--threshold',   '-t',    help='Allowed slowdown vs baseline, default: 0.2 => 20%%',  type=float, default=0.2)
+    parser.add_argument('--debug',       '-dbg',  help='Debug mode',  action='store_true')
+    return parser
+
+
+def random_text(rng, size):
+    """return printable text lines of about {size} bytes"""
+    lines = list()
+    total = 0
+    while total < size:
+        line = ' '.join(f'{rng.getrandbits(32):08x}' for _ in range(rng.randint(1, 12))) + '\n'
+        lines.append(line)
+        total += len(line)
+    return ''.join(lines)[:size]
+
+
+def build_trees(root, args, rng):
+    """create root/dir1 and root/dir2 trees, dir2 has the same relative paths as dir1"""
+    dir1, dir2 = root / 'dir1', root / 'dir2'
+    log_min, log_max = math.log(args.size_min), math.log(max(args.size_min, args.size_max))
+    for i in range(args.files):
+        subdir = Path(*[f'd{rng.randrange(8)}' for _ in range(rng.randint(0, args.depth))])
+        name = f'file{i}.txt'
+        text = random_text(rng, int(math.exp(rng.uniform(log_min, log_max))))
+        for top in (dir1, dir2):
+            (top / subdir).mkdir(parents=True, exist_ok=True)
+        (dir1 / subdir / name).write_text(text)
+        if rng.uniform(0, 100) >= args.identical:
+            if rng.random() < 0.5:  ## same size edit
+                pos = rng.randrange(len(text)) if text else 0
+                text = text[:pos] + ('x' if text[pos:pos + 1] != 'x' else 'y') + text[pos + 1:]
+            else:
+                text += random_text(rng, 64)
+        (dir2 / subdir / name).write_text(text)
+        if rng.uniform(0, 100) < args.dup_names:  ## same basename elsewhere in dir2
+            (dir2 / 'dups').mkdir(exist_ok=True)
+            (dir2 / 'dups' / f'{i}').mkdir(exist_ok=True)
+            (dir2 / 'dups' / f'{i}' / name).write_text(text)
+    ## compare_files.py writes its log to the cwd, keep it out of the compare
+    (dir1 / 'compare_files.ini').write_text('[default]\n    rglob_excludes = compare_files.\n')
+    return dir1, dir2
+
+
+def best_of(repeat, func):
+    """run func() {repeat} times and return the result of the fastest run as (seconds, result)"""
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, result)
+    return best
+
+
+def bench_compare(args, rng, log):
+    results = dict()
+    with tempfile.TemporaryDirectory(prefix='bench_compare_') as tmp:
+        root = Path(tmp)
+        dir1, dir2 = build_trees(root, args, rng)
+        profile_json = root / 'profile.json'
+        cmd = [sys.executable, str(script_dir / 'compare_files.py'), '--dir2', str(dir2),
+               '--profile_json', str(profile_json)] + args.compare_args.split()
+        log.info(f'compare cmd: {" ".join(cmd)}')
+
+        def run():
+            ## compare_files.py reads the compare_files.ini of the cwd, run it from dir1
+            subprocess.run(cmd, cwd=dir1, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with open(profile_json) as fh:
+                return json.load(fh)
+
+        elapsed, profile = best_of(args.repeat, run)
+        results['compare.end_to_end'] = elapsed
+        for phase in ('discovery', 'index', 'lookup', 'compare', 'diff'):
+            if phase in profile['timers']:
+                results[f'compare.{phase}'] = profile['timers'][phase]['total'] / pow(10, 9)
+    return results
+
+
+def bench_diff(args, rng, log):
+    results = dict()
+    null_log = logging.getLogger('bench_compare.diff')
+    null_log.addHandler(logging.NullHandler())
+    null_log.propagate = False
+    with tempfile.TemporaryDirectory(prefix='bench_diff_') as tmp:
+        fromfile, tofile = Path(tmp, 'from.txt'), Path(tmp, 'to.txt')
+        lines = [f'line {i} {rng.getrandbits(64):016x}\n' for i in range(args.diff_lines)]
+        fromfile.write_text(''.join(lines))
+        for _ in range(int(args.diff_lines * args.edit_density)):
+            pos = rng.randrange(len(lines))
+            op = rng.random()
+            if op < 0.4:
+                lines[pos] = f'edited {rng.getrandbits(32):08x}\n'
+            elif op < 0.7:
+                del lines[pos]
+            else:
+                lines.insert(pos, f'inserted {rng.getrandbits(32):08x}\n')
+        tofile.write_text(''.join(lines))
+
+        modes = {
+            'difflib': ['-u'],
+            'myers': ['-u', '--algorithm', 'myers'],
+            'stream': ['-u', '--stream'],
+        }
+        for name, opts in modes.items():
+            diff_args = diff.get_parser().parse_args(opts + ['--maxdiff', '0', str(fromfile), str(tofile)])
+            elapsed, _ = best_of(args.repeat, lambda: diff.diff(args=diff_args, log=null_log))
+            results[f'diff.{name}'] = elapsed
+    return results
+
+
+def import_time(module):
+    """return cumulative import time of module in seconds as reported by python -X importtime"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=script_dir,
+                          check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    ## import time: self [us] | cumulative | imported package
+    for line in proc.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / pow(10, 6)
+    raise ValueError(f'no import time of {module} in: {proc.stderr}')
+
+
+def bench_startup(args, log):
+    results = dict()
+    for module in ('pyutils', 'diff', 'compare_files'):
+        results[f'startup.{module}'] = min(import_time(module) for _ in range(max(1, args.repeat)))
+    return results
+
+
+## files of the include check tree and the patterns that must select the same files as Path.rglob()
+include_files = ['a.txt', 'Makefile', 'foo.d/Makefile', 'foo.d/x.c', '.git/HEAD', '.git/config', '.gitignore',
+                 'src/a.py', 'src/b.txt', 'x/src/b.py', 'x/y/src/c.py', 'x/srcs/d.py', 'lib/src/sub/e.py']
+include_patterns = ['*.*', 'src/*.py', '*/src/*.py', '*', '**/src/*.py', '*.d/*']
+
+
+def check_includes(log):
+    """return the include patterns for which compare_files.iter_files() and Path.rglob() select different files"""
+    import compare_files
+    mismatches = list()
+    with tempfile.TemporaryDirectory(prefix='bench_includes_') as tmp:
+        for name in include_files:
+            path = Path(tmp, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(name)
+        for pattern in include_patterns:
+            walked = sorted(os.path.relpath(x, tmp) for x in compare_files.iter_files(tmp, includes=compare_files.compile_includes([pattern])))
+            globbed = sorted(str(x.relative_to(tmp)) for x in Path(tmp).rglob(pattern) if x.is_file())
+            if walked != globbed:
+                log.error(f'include pattern: {pattern}, iter_files: {walked}, rglob: {globbed}')
+                mismatches.append(pattern)
+    return mismatches
+
+
+def check_baseline(results, baseline_file, threshold, log):
+    """return the list of timings slower than baseline by more than threshold"""
+    with open(baseline_file) as fh:
+        baseline = json.load(fh)['results']
+    regressions = list()
+    for name, elapsed in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = elapsed / base
+        status = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+        log.info(f'{name}: {elapsed:.4f}s, baseline: {base:.4f}s, ratio: {ratio:.2f} {status}')
+        if status != 'ok':
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    args = get_parser().parse_args()
+    log = pyutils.init_logger(name='bench_compare', debug=args.debug)
+    rng = random.Random(args.seed)
+
+    results = dict()
+    if 'compare' not in args.skip:
+        results.update(bench_compare(args, rng, log))
+    if 'diff' not in args.skip:
+        results.update(bench_diff(args, rng, log))
+    if 'startup' not in args.skip:
+        results.update(bench_startup(args, log))
+    for name, elapsed in results.items():
+        log.info(f'{name}: {pyutils.time_diff_ns(0, int(elapsed * pow(10, 9)))}')
+
+    config = {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'debug')}
+    data = dict(config=config, python=sys.version.split()[0], results=results)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(data, fh, indent=2)
+        log.info(f'results: {args.output}')
+
+    failed = False
+    if 'includes' not in args.skip and check_includes(log):
+        failed = True
+    over_budget = [name for name, elapsed in results.items() if name.startswith('startup.') and elapsed * 1000 > args.startup_budget]
+    if over_budget:
+        log.error(f'import time over budget of {args.startup_budget}ms: {over_budget}')
+        failed = True
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.threshold, log)
+        if regressions:
+            log.error(f'regressions over {args.threshold:.0%}: {regressions}')
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
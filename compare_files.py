@@ -1,120 +1,1314 @@
 #!/usr/bin/env python3
-import argparse, configparser, sys, os, subprocess, filecmp
+import argparse, sys, os, json, logging, collections, itertools, time
 from pathlib import Path
-import pyutils, diff
-
-# arguments parser
-parser = argparse.ArgumentParser()
-parser.add_argument('--dir1',        '-d1',    help='Source dir #1, default: all files under current dir',  type=str)
-parser.add_argument('--dir2',        '-d2',    help='Source dir #2',  type=str)
-parser.add_argument('--match_path',  '-mp',    help='Match relative paths to files from dir1 & dir2',  action='store_true')
-parser.add_argument('--limit',       '-lim',   help='Limit # files to compare',  type=int, default=0)
-parser.add_argument('--diff',        '-di',    help='Select diff format. Default: disabled.',  type=str, choices=['context', 'unified', 'ndiff', 'html'])
-parser.add_argument('--debug',       '-dbg',   help='Debug mode',  action='store_true')
-args = parser.parse_args()
-
-
-log = pyutils.init_logger(name=__name__, script=__file__, debug=args.debug)
-
-
-## config file candidates are read in order with latest file options with highest priority
-## base config file from script dir
-config_files = [Path(__file__).with_suffix('.ini')]
-## next higer priority config file from home directory
-homedir = os.getenv('HOME', '')
-if homedir:
-   config_files.append(Path(homedir) / 'compare_files.ini')
-## next higher priority config file from cwd
-cwd = Path.cwd()
-config_files.append(cwd / 'compare_files.ini')
-
-config_files = [str(x) for x in config_files]  ## convert to strs
-log.debug(f'config_files: {config_files}')
-
-config = configparser.ConfigParser()
-with open(config_files[0]) as cf:
-    config.read_file(cf)
-## config.read() automatically ignores the files that do not exist
-if len(config_files) > 1:
-    config.read(config_files[1:])
-
-## get config from 'default' section and convert items to list
-config = dict(config['default'])
-for key in config:
-    config[key] = config[key].split(',')
-log.info(config)
-
-
-dir1 = Path(args.dir1) if args.dir1 else cwd
-rglob_includes = config['rglob_includes']
-rglob_excludes = config['rglob_excludes']
-
-
-src1_paths = list()
-src1_list = list()
-for pattern in rglob_includes:
-    src1_paths.extend(list(dir1.rglob(pattern)))  
-
-## convert src to str so in operator and other string methods can be used
-src1_paths = [str(x) for x in src1_paths]
-for src in src1_paths:
-   exclude = False
-   for exl in rglob_excludes:
-      if exl in src:
-         exclude = True ## skip file when exl pattern is found
-   if not exclude:
-       src1_list.append(src)
-log.info(f'found {len(src1_list)} files to compare ...')
-
-files_equal = list()
-files_diff = list()
-files_not_found = list()
-
-if args.limit:
-   src1_list = src1_list[:args.limit]
-
-#log.debug([x.name for x in src1_list])
-for src1 in src1_list:
-   src2 = None
-   src2_path = None
-   dir1_str = str(dir1) + '/'
-   if src1.startswith(dir1_str):
-       src1 = pyutils.remove_prefix(prefix=dir1_str, text=src1)
-
-   if args.match_path: ## use same relative paths to files
-      src2_path = Path(args.dir2, src1)
-      if(src2_path.is_file()):
-        src2 = str(src2_path)
-   else: # use find to locate file in anywhere under dir2
-      src2_path = src1 ## default to src1 for "not found" reporting
-      sh_cmds = ['find', args.dir2, f'-name "{src1}"']
-      sh_cmd_str =' '.join(sh_cmds)
-      log.debug('sh_cmd: {}'.format(sh_cmd_str))
-      proc = subprocess.Popen(sh_cmd_str, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-      out, err = proc.communicate()
-      out_lines = [line.strip() for line in out.decode().split('\n') if line.strip() != '']
-      if out_lines:
-          log.debug(f'found: {out_lines}')
-          if len(out_lines) > 1:
-               ## use first match when multiple matches are found
-               log.info(f'found multiple matches for: {src1}, found: {out_lines}')
-          src2 = out_lines[0]
-          src2_path = Path(src2)
-
-   if src2:
-      if filecmp.cmp(src1, src2, shallow=False):
-         files_equal.append(f'{src2}  {src1}')
-         log.info(f'{src1} => files are equal')
-      else:
-         files_diff.append(f'{src2}  {src1}')
-         log.info(f'{src1} => files are different')
-         if args.diff:
-             diff_args = diff.get_parser().parse_args([f'--{args.diff}', src1, src2])
-             diff.diff(args=diff_args, log=log)
-   else:
-      log.info(f'{str(src2_path)} => file not found in dir2!')
-      files_not_found.append( src1)
-
-log.info('files equal: {} {}\n'.format(len(files_equal), pyutils.to_str(files_equal)))
-log.info('files different: {} {}\n'.format(len(files_diff), pyutils.to_str(files_diff)))
-log.info('files not found: {} {}\n'.format(len(files_not_found), pyutils.to_str(files_not_found)))
+import pyutils
+
+
+def walk_entries(top, prune=None, log=None):
+    """yield os.DirEntry of every dir and file under top in the same depth-first order as find,
+    without following symlinks to dirs.
+        prune: Optional function of a dir entry, the dir is skipped without descending when it returns True
+        log: Optional logger, dirs that cannot be scanned are logged as warnings and skipped like pathlib does
+    """
+    def scandir(path):
+        try:
+            return os.scandir(path)
+        except OSError as e:
+            (log or logging.getLogger(__name__)).warning(f'skipped dir: {e}')
+
+    it = scandir(top)
+    stack = [it] if it else []
+    while stack:
+        for entry in stack[-1]:
+            if entry.is_dir(follow_symlinks=False):
+                if prune and prune(entry):
+                    continue
+                yield entry
+                it = scandir(entry.path)
+                if it:
+                    stack.append(it)
+                    break  ## descend first, resume the parent iterator afterwards
+                continue
+            yield entry
+        else:
+            stack.pop().close()
+
+
+def translate_glob(pattern):
+    """return regex of a glob pattern where * ? and [...] never match '/' and ** matches any # of dirs"""
+    import re
+    regex = list()
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*' and pattern[i:i + 2] == '*/':
+            regex.append('(?:[^/]+/)*')
+            i += 2
+        elif c == '*':
+            regex.append('[^/]*')
+        elif c == '?':
+            regex.append('[^/]')
+        elif c == '[':
+            ## same bracket scan as fnmatch, a ']' right after '[' or '[!' is part of the set
+            end = i
+            if end < n and pattern[end] == '!':
+                end += 1
+            if end < n and pattern[end] == ']':
+                end += 1
+            while end < n and pattern[end] != ']':
+                end += 1
+            if end >= n:  ## no closing ']', match '[' literally
+                regex.append('\\[')
+                continue
+            chars = pattern[i:end].replace('\\', '\\\\')
+            if chars[0] == '!':
+                chars = '^' + chars[1:]
+            elif chars[0] == '^':
+                chars = '\\' + chars
+            regex.append(f'(?!/)[{chars}]')
+            i = end + 1
+        else:
+            regex.append(re.escape(c))
+    return ''.join(regex)
+
+
+def compile_includes(patterns):
+    """compile rglob style include patterns into one regex searched in paths relative to the walk top.
+    Like rglob, a pattern matches the trailing path components at any depth, e.g. src/*.py matches
+    src/a.py and lib/src/b.py, and wildcards do not match across '/'
+    """
+    import re
+    regexes = list()
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        regexes.append(f'(?:^|/){translate_glob(pattern)}$')
+    if not regexes:
+        return None
+    return re.compile('|'.join(f'(?:{x})' for x in regexes))
+
+
+def compile_excludes(patterns):
+    """compile exclude substrings into a pyutils.SubstringMatcher, empty patterns are ignored"""
+    patterns = [x.strip() for x in patterns if x.strip()]
+    if not patterns:
+        return None
+    return pyutils.SubstringMatcher(patterns)
+
+
+def iter_files(top, includes=None, excludes=None):
+    """lazily yield paths of files under top in a single walk.
+        includes: Optional compiled regex from compile_includes(), searched in the path relative to top, all files are included by default
+        excludes: Optional matcher from compile_excludes(), excludes override includes.
+                  dirs are pruned when every path under them contains an exclude pattern.
+    """
+    top = str(top)
+    prune = (lambda entry: excludes.any(entry.path + '/')) if excludes else None
+    for entry in walk_entries(top, prune=prune):
+        if entry.is_dir(follow_symlinks=False) or not entry.is_file():
+            continue
+        path = entry.path
+        if excludes and excludes.any(path):
+            continue
+        if includes and not includes.search(os.path.relpath(path, top)):
+            continue
+        yield path
+
+
+class DirIndex:
+    """basename => list of paths index of all files under top, built with a single scandir walk.
+        index_file: Optional json file to persist the index, it is reused as long as
+                    the mtime of every dir under top is unchanged.
+    """
+    version = 1
+
+    def __init__(self, top, index_file=None, log=None):
+        self.top = str(top)
+        self.index_file = index_file
+        self.log = log
+        self.index = dict()
+        self.dir_mtimes = dict()
+        if not (index_file and self.load()):
+            self.scan()
+            if index_file:
+                self.save()
+
+    def scan(self):
+        self.index = dict()
+        self.dir_mtimes = {self.top: os.stat(self.top).st_mtime_ns}
+        for entry in walk_entries(self.top, log=self.log):
+            if entry.is_dir(follow_symlinks=False):
+                self.dir_mtimes[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+            elif entry.is_file():
+                self.index.setdefault(entry.name, []).append(entry.path)
+        if self.log:
+            self.log.info(f'indexed {sum(len(x) for x in self.index.values())} files in {len(self.dir_mtimes)} dirs under {self.top}')
+
+    def is_valid(self):
+        """a file add/remove/rename always updates the mtime of its parent dir"""
+        for path, mtime_ns in self.dir_mtimes.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def load(self):
+        try:
+            with open(self.index_file) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != self.version or data.get('root') != os.path.abspath(self.top):
+            return False
+        self.index = data['index']
+        self.dir_mtimes = data['dir_mtimes']
+        if not self.is_valid():
+            if self.log:
+                self.log.info(f'index_file: {self.index_file} is stale, rescanning {self.top}')
+            return False
+        if self.log:
+            self.log.info(f'loaded index for {self.top} from index_file: {self.index_file}')
+        return True
+
+    def save(self):
+        data = dict(version=self.version, root=os.path.abspath(self.top), dir_mtimes=self.dir_mtimes, index=self.index)
+        with open(self.index_file, 'w') as fh:
+            json.dump(data, fh)
+
+    def lookup(self, name):
+        """return all paths with basename of name, in find order"""
+        return self.index.get(os.path.basename(name), [])
+
+
+class HashCache:
+    """persistent sqlite cache of file content digests keyed on (path, size, mtime_ns, inode).
+        db_file: sqlite db file, created when it does not exist, None keeps the digests in memory only
+        rehash: ignore the cached digests and hash every file again
+        table: sqlite table of the digests
+        digest_func: function of a path returning its digest, default: pyutils.file_digest
+    All rows are loaded up front so lookups from worker threads never touch sqlite.
+    """
+    def __init__(self, db_file, rehash=False, log=None, table='files', digest_func=None):
+        import sqlite3, threading
+        self.db_file = db_file
+        self.rehash = rehash
+        self.log = log
+        self.table = table
+        self.digest_func = digest_func or pyutils.file_digest
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.updated = dict()  ## path => (size, mtime_ns, inode, digest) hashed in this run
+        self.seen = set()      ## paths looked up in this run
+        self.entries = dict()
+        if not db_file:
+            return
+        with sqlite3.connect(db_file) as db:
+            db.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                       '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, digest TEXT)')
+            self.entries = {row[0]: row[1:] for row in db.execute(f'SELECT * FROM {table}')}
+        if log:
+            log.info(f'loaded {len(self.entries)} digests from hash_cache: {db_file}, table: {table}')
+
+    def cached(self, path, st=None):
+        """return the cached digest of path when it is still valid, None otherwise"""
+        path = os.path.abspath(path)
+        st = st or os.stat(path)
+        entry = self.entries.get(path)
+        with self.lock:
+            self.seen.add(path)
+            if entry and not self.rehash and tuple(entry[:3]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+                self.hits += 1
+                return entry[3]
+        return None
+
+    def digest(self, path, new=None, st=None):
+        """return content digest of path, hash the file only when it is new or modified.
+            new: Optional list to collect the (path, entry) of freshly hashed files
+            st: Optional os.stat result of path
+        """
+        path = os.path.abspath(path)
+        st = st or os.stat(path)
+        digest = self.cached(path, st)
+        if digest:
+            return digest
+        entry = (st.st_size, st.st_mtime_ns, st.st_ino, self.digest_func(path))
+        with self.lock:
+            self.misses += 1
+            self.entries[path] = entry
+            self.updated[path] = entry
+        if new is not None:
+            new.append((path, entry))
+        return entry[3]
+
+    def merge(self, new):
+        """record (path, entry) digests, used to collect the digests computed in other processes"""
+        with self.lock:
+            self.misses += len(new)
+            for path, entry in new:
+                self.entries[path] = entry
+                self.updated[path] = entry
+                self.seen.add(path)
+
+    def save(self):
+        """write digests hashed in this run and evict entries of deleted files"""
+        import sqlite3
+        evicted = [path for path in self.entries if path not in self.seen and not os.path.exists(path)]
+        if self.db_file:
+            with sqlite3.connect(self.db_file) as db:
+                db.executemany(f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)',
+                               [(path,) + tuple(entry) for path, entry in self.updated.items()])
+                db.executemany(f'DELETE FROM {self.table} WHERE path = ?', [(path,) for path in evicted])
+        for path in evicted:
+            del self.entries[path]
+        if self.log:
+            self.log.info(f'hash_cache: {self.db_file or "memory"}, table: {self.table}, hits: {self.hits}, hashed: {self.misses}, evicted: {len(evicted)}')
+        self.updated.clear()  ## counts and lookups restart for the next run of a warm cache
+        self.seen.clear()
+        self.hits = self.misses = 0
+
+
+def read_block(fh, buf):
+    """fill the reused bytearray buf from a raw file with readinto(), return # of bytes read"""
+    got = 0
+    with memoryview(buf) as view:
+        while got < len(buf):
+            n = fh.readinto(view[got:])
+            if not n:
+                break
+            got += n
+    return got
+
+
+def first_diff(data1, data2):
+    """return offset of the first differing byte of two bytes-like objects, None when equal"""
+    size = min(len(data1), len(data2))
+    if data1[:size] == data2[:size]:
+        return None if len(data1) == len(data2) else size
+    lo, hi = 0, size  ## binary search keeps every compare a memcmp of a shrinking range
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if data1[lo:mid] == data2[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def compare_bytes(src1, src2, block_size=1 << 20):
+    """compare file contents block by block, reading into two reused bytearrays so no buffer
+    is allocated per block. Full blocks are compared as bytearrays which is a single memcmp.
+    return (offset, blocks): offset of the first differing byte, None when files are equal,
+                             and the # of differing blocks
+    """
+    buf1, buf2 = bytearray(block_size), bytearray(block_size)
+    offset = None
+    blocks = 0
+    pos = 0
+    with open(src1, 'rb', buffering=0) as fh1, open(src2, 'rb', buffering=0) as fh2:
+        while True:
+            n1, n2 = read_block(fh1, buf1), read_block(fh2, buf2)
+            if n1 == n2 == block_size:
+                equal = buf1 == buf2
+            else:  ## last block, the buffers are not reused anymore
+                del buf1[n1:], buf2[n2:]
+                equal = buf1 == buf2
+            if not equal:
+                blocks += 1
+                if offset is None:
+                    offset = pos + first_diff(buf1, buf2)
+            if n1 < block_size or n2 < block_size:
+                break
+            pos += block_size
+    return offset, blocks
+
+
+def is_binary(path, size=8000):
+    """files with a NUL byte in the first {size} bytes are treated as binary, like git does"""
+    with open(path, 'rb') as fh:
+        return b'\0' in fh.read(size)
+
+
+def read_edges(fh, size, edge_size):
+    """return the first and last edge_size bytes of an open file of given size"""
+    head = fh.read(edge_size)
+    fh.seek(max(size - edge_size, edge_size))
+    return head + fh.read(edge_size)
+
+
+def partial_digest(path, size, edge_size=8 << 10):
+    """digest of the first and last edge_size bytes of path, it covers the whole content up to 2 * edge_size bytes"""
+    import hashlib
+    with open(path, 'rb') as fh:
+        return hashlib.blake2b(read_edges(fh, size, edge_size)).hexdigest()
+
+
+def staged_compare(src1, src2, hash_cache=None, digests=None, edge_size=8 << 10, st1=None, st2=None):
+    """compare file contents running the cheap checks first, later stages only see the survivors:
+        samefile: same inode => equal
+        size:     size mismatch => different
+        cache:    both digests valid in hash_cache => compare digests
+        edges:    first/last {edge_size} bytes mismatch => different, settles small files completely,
+                  a difference only in the last bytes of a larger file has no offset as the middle is not read
+        full:     block compare reporting the first difference, or digest compare with hash_cache
+    return (equal, stage, offset, blocks) where stage is the name of the stage that settled the pair,
+    offset is the first differing byte and blocks the # of differing blocks when they are known.
+        st1, st2: Optional os.stat results of src1 and src2, e.g. from os.DirEntry.stat()
+    """
+    st1, st2 = st1 or os.stat(src1), st2 or os.stat(src2)
+    if (st1.st_dev, st1.st_ino) == (st2.st_dev, st2.st_ino):
+        return True, 'samefile', None, None
+    if st1.st_size != st2.st_size:
+        return False, 'size', None, None
+    if hash_cache:
+        digest1, digest2 = hash_cache.cached(src1, st1), hash_cache.cached(src2, st2)
+        if digest1 and digest2:
+            return digest1 == digest2, 'cache', None, None
+    with open(src1, 'rb') as fh1, open(src2, 'rb') as fh2:
+        edges1, edges2 = read_edges(fh1, st1.st_size, edge_size), read_edges(fh2, st2.st_size, edge_size)
+    offset = first_diff(edges1, edges2)
+    if offset is not None and offset >= edge_size:
+        if st1.st_size > 2 * edge_size:  ## the unread middle can hold an earlier difference
+            return False, 'edges', None, None
+        offset += max(st1.st_size - edge_size, edge_size) - edge_size  ## map the offset in the tail back to the file
+    if offset is not None or st1.st_size <= 2 * edge_size:
+        return offset is None, 'edges', offset, None
+    if hash_cache:
+        equal = hash_cache.digest(src1, digests, st1) == hash_cache.digest(src2, digests, st2)
+        return equal, 'full', None, None
+    offset, blocks = compare_bytes(src1, src2)
+    return offset is None, 'full', offset, blocks
+
+
+class Normalizer:
+    """fingerprints of the normalized content of text files, files with equal fingerprints are equivalent.
+        ignore_eol: CRLF and CR line endings equal LF, a missing EOL at the end of file is ignored
+        ignore_whitespace: trailing => trailing whitespace is ignored, change => runs of whitespace equal
+                           a single space, all => all whitespace is ignored, like diff -Z, -b and -w
+        ignore_lines: regexes, lines matching any of them are left out, e.g. timestamp headers
+    Files are read line by line so fingerprints take constant memory.
+    """
+    whitespace_modes = ('trailing', 'change', 'all')
+
+    def __init__(self, ignore_eol=False, ignore_whitespace=None, ignore_lines=()):
+        import hashlib, re
+        if ignore_whitespace and ignore_whitespace not in self.whitespace_modes:
+            raise ValueError(f'invalid ignore_whitespace: {ignore_whitespace}, expected one of: {self.whitespace_modes}')
+        self.ignore_eol = ignore_eol
+        self.ignore_whitespace = ignore_whitespace
+        self.ignore_lines = list(ignore_lines)
+        self.mask = re.compile('|'.join(f'(?:{x})' for x in self.ignore_lines)) if self.ignore_lines else None
+        self.spaces = re.compile(r'\s+')
+        ## fingerprints are only comparable between equal rules
+        self.key = hashlib.blake2b(repr((ignore_eol, ignore_whitespace, self.ignore_lines)).encode(), digest_size=8).hexdigest()
+
+    @classmethod
+    def from_config(cls, config):
+        """return Normalizer of the ignore_* config options, None when no normalization is configured"""
+        option = lambda key: ','.join(config.get(key, [])).strip().lower()
+        ignore_eol = option('ignore_eol') in ('1', 'yes', 'true', 'on')
+        ignore_whitespace = option('ignore_whitespace') or None
+        ignore_lines = [x.strip() for x in config.get('ignore_lines', []) if x.strip()]
+        if not (ignore_eol or ignore_whitespace or ignore_lines):
+            return None
+        return cls(ignore_eol, ignore_whitespace, ignore_lines)
+
+    def normalize(self, line):
+        """return the normalized line, None when it is ignored"""
+        body = line.rstrip('\r\n')
+        if self.mask and self.mask.search(body):
+            return None
+        eol = '\n' if self.ignore_eol else line[len(body):]
+        if self.ignore_whitespace == 'trailing':
+            body = body.rstrip()
+        elif self.ignore_whitespace == 'change':
+            body = self.spaces.sub(' ', body).rstrip()
+        elif self.ignore_whitespace == 'all':
+            body = self.spaces.sub('', body)
+        return body + eol
+
+    def fingerprint(self, path):
+        """return digest of the normalized lines of path"""
+        import hashlib
+        h = hashlib.blake2b()
+        ## universal newlines translate CRLF and CR to LF, surrogateescape round trips any bytes
+        with open(path, encoding='utf-8', errors='surrogateescape', newline=None if self.ignore_eol else '') as fh:
+            for line in fh:
+                line = self.normalize(line)
+                if line is not None:
+                    h.update(line.encode('utf-8', 'surrogateescape'))
+        return h.hexdigest()
+
+
+## result of a single src1 compare returned by the workers
+Result = collections.namedtuple('Result', 'status src1 src2 stage offset blocks sig1 sig2 log digests timings page fingerprints '
+                                'hits fingerprint_hits', defaults=(None, (), 0, 0))
+
+
+def stat_sig(path, st=None):
+    """return [size, mtime_ns, inode] signature of path, None when it does not exist"""
+    try:
+        st = st or os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def match_content(paths1, paths2, hash_cache=None, jobs=1, edge_size=8 << 10, log=None):
+    """pair each file of paths1 with the files of identical content in paths2 irrespective of their names,
+    later stages only hash the files still colliding with a file of the other side:
+        size:    files are bucketed by size, a size found on one side only has no match
+        partial: digest of the first/last {edge_size} bytes, settles files up to 2 * {edge_size} bytes
+        full:    digest of the whole content, from hash_cache when given
+    return {path1: (stage, [paths2])} where stage is the name of the stage that settled path1
+    """
+    buckets = collections.defaultdict(lambda: ([], []))  ## key => (files1, files2)
+    for side, paths in enumerate((paths1, paths2)):
+        for path in paths:
+            st = os.stat(path)
+            buckets[st.st_size][side].append((path, st))
+
+    matches = dict()
+    for stage in ('size', 'partial', 'full'):
+        candidates = list()  ## (key, side, path, st) of the files colliding with the other side
+        for key, (files1, files2) in buckets.items():
+            if files1 and files2 and stage != 'full' and not (stage == 'partial' and key[0] <= 2 * edge_size):
+                candidates.extend((key, side, path, st) for side, files in enumerate((files1, files2)) for path, st in files)
+                continue
+            found = [path for path, _ in files2]
+            for path, _ in files1:
+                matches[path] = (stage, found)
+        if not candidates:
+            break
+        if stage == 'size':
+            hasher = lambda c: (c[0], partial_digest(c[2], c[0], edge_size))
+        elif hash_cache:
+            hasher = lambda c: (c[0][0], hash_cache.digest(c[2], st=c[3]))
+        else:
+            hasher = lambda c: (c[0][0], pyutils.file_digest(c[2]))
+        buckets = collections.defaultdict(lambda: ([], []))
+        for cand, key in zip(candidates, ordered_map(hasher, candidates, jobs=jobs)):
+            buckets[key][cand[1]].append(cand[2:])
+        if log:
+            log.debug(f'content match: {len(candidates)} files hashed after stage: {stage}')
+    return matches
+
+
+class TreeMerge:
+    """walk dir1 and dir2 together with a single scandir per dir, merge-joining the name sorted entries
+    of each dir into files only in dir1, only in dir2 and in both under the same relative path.
+    Every dir gets a Merkle-style digest per side from the names, sizes, mtimes and inodes of its files
+    and the digests of its subdirs, all from the os.DirEntry stats.
+        includes, excludes: Optional matchers from compile_includes() and compile_excludes()
+        state_file: Optional json file of the digests of the subtrees found identical by the previous run,
+                    the file pairs of a subtree with both digests unchanged are not compared again
+        key: Optional json value of the options the comparison depends on (include/exclude patterns,
+             normalizer), the state saved under another key is ignored
+    """
+    version = 1
+
+    def __init__(self, dir1, dir2, includes=None, excludes=None, state_file=None, key=None, log=None):
+        self.dir1, self.dir2 = str(dir1), str(dir2)
+        self.includes, self.excludes = includes, excludes
+        self.key = key
+        self.state_file = state_file
+        self.log = log
+        self.pairs = list()   ## (rel, path1, path2, st1, st2) of the files in both dirs to compare
+        self.pruned = list()  ## (rel, path1, path2, st1, st2) of the files in unchanged identical subtrees
+        self.only1 = list()   ## (rel, path1, st1)
+        self.only2 = list()   ## (rel, path2, st2)
+        self.digests = dict() ## rel dir => [digest1, digest2] of the dirs in both dirs
+        self.state = dict()
+        if state_file:
+            self.load()
+        self.merge('')
+        if log:
+            log.info(f'tree merge: {len(self.pairs) + len(self.pruned)} files in both dirs, {len(self.pruned)} in unchanged subtrees, '
+                     f'{len(self.only1)} only in dir1, {len(self.only2)} only in dir2')
+
+    def load(self):
+        try:
+            with open(self.state_file) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        ## json round trips tuples as lists
+        if [data.get('version'), data.get('dir1'), data.get('dir2'), data.get('key')] == \
+           json.loads(json.dumps([self.version, os.path.abspath(self.dir1), os.path.abspath(self.dir2), self.key])):
+            self.state = data['digests']
+
+    def scan(self, top):
+        """return the entries of dir top sorted by name, excluded dirs and files are left out,
+        None when top cannot be scanned"""
+        try:
+            with os.scandir(top) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            (self.log or logging.getLogger(__name__)).warning(f'skipped dir: {e}')
+            return None
+        if self.excludes:
+            entries = [entry for entry in entries if not self.excludes.any(entry.path + '/' if entry.is_dir(follow_symlinks=False) else entry.path)]
+        return entries
+
+    def included(self, rel):
+        return not self.includes or self.includes.search(rel)
+
+    def walk_one(self, top, rel, out):
+        """append (rel, path, st) of the files under dir top of one side only to out"""
+        prune = (lambda entry: self.excludes.any(entry.path + '/')) if self.excludes else None
+        for entry in walk_entries(top, prune=prune, log=self.log):
+            if entry.is_dir(follow_symlinks=False) or not entry.is_file():
+                continue
+            if self.excludes and self.excludes.any(entry.path):
+                continue
+            path_rel = os.path.join(rel, os.path.relpath(entry.path, top))
+            if self.included(path_rel):
+                out.append((path_rel, entry.path, entry.stat()))
+
+    def merge(self, rel):
+        """merge-join dir1/rel with dir2/rel recursively, return the digests of both sides.
+        A subtree that cannot be scanned on either side is skipped with None digests."""
+        import hashlib
+        hashes = (hashlib.blake2b(digest_size=16), hashlib.blake2b(digest_size=16))
+        entries = (self.scan(os.path.join(self.dir1, rel)), self.scan(os.path.join(self.dir2, rel)))
+        if None in entries:
+            return [None, None]
+        start = len(self.pairs)
+        identical = True  ## no entry only in one dir
+        i = j = 0
+        while i < len(entries[0]) or j < len(entries[1]):
+            entry1 = entries[0][i] if i < len(entries[0]) else None
+            entry2 = entries[1][j] if j < len(entries[1]) else None
+            if entry2 is None or (entry1 is not None and entry1.name < entry2.name):
+                self.add_only(rel, entry1, self.only1, hashes[0])
+                identical = False
+                i += 1
+                continue
+            if entry1 is None or entry2.name < entry1.name:
+                self.add_only(rel, entry2, self.only2, hashes[1])
+                identical = False
+                j += 1
+                continue
+            i += 1
+            j += 1
+            entry_rel = os.path.join(rel, entry1.name)
+            is_dir1, is_dir2 = entry1.is_dir(follow_symlinks=False), entry2.is_dir(follow_symlinks=False)
+            if is_dir1 and is_dir2:
+                for h, digest in zip(hashes, self.merge(entry_rel)):
+                    h.update(f'{entry1.name}/{digest}\n'.encode())
+            elif not (is_dir1 or is_dir2) and entry1.is_file() and entry2.is_file():
+                st1, st2 = entry1.stat(), entry2.stat()
+                for h, st in zip(hashes, (st1, st2)):
+                    h.update(f'{entry1.name}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}\n'.encode())
+                if self.included(entry_rel):
+                    self.pairs.append((entry_rel, entry1.path, entry2.path, st1, st2))
+            else:  ## a file and a dir, or not regular files
+                self.add_only(rel, entry1, self.only1, hashes[0])
+                self.add_only(rel, entry2, self.only2, hashes[1])
+                identical = False
+        digests = [h.hexdigest() for h in hashes]
+        self.digests[rel] = digests
+        if identical and self.state.get(rel) == digests:
+            self.pruned.extend(self.pairs[start:])
+            del self.pairs[start:]
+        return digests
+
+    def add_only(self, rel, entry, out, h):
+        h.update(f'{entry.name}\0only\n'.encode())
+        entry_rel = os.path.join(rel, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            self.walk_one(entry.path, entry_rel, out)
+        elif entry.is_file() and self.included(entry_rel):
+            out.append((entry_rel, entry.path, entry.stat()))
+
+    def save(self, rels):
+        """save the digests of the subtrees without any of the rels, the relative paths of the files not equal"""
+        dirty = set()
+        for rel in rels:
+            while rel:
+                rel = os.path.dirname(rel)
+                if rel in dirty:
+                    break
+                dirty.add(rel)
+        digests = {rel: digests for rel, digests in self.digests.items() if rel not in dirty}
+        with open(self.state_file, 'w') as fh:
+            json.dump(dict(version=self.version, dir1=os.path.abspath(self.dir1), dir2=os.path.abspath(self.dir2), key=self.key, digests=digests), fh)
+        if self.log:
+            self.log.info(f'tree_state: {self.state_file}, identical dirs: {len(digests)} of {len(self.digests)}')
+
+
+class Journal:
+    """append-only JSONL file with one record per decided pair, written as soon as it is decided
+    so the results of an interrupted run are kept and can be resumed.
+        resume: load the records of earlier runs and append to them, otherwise the journal is truncated
+    A src1 can have several records after resumed runs, the last one wins.
+    """
+    fields = ('src1', 'src2', 'status', 'stage', 'offset', 'blocks', 'sig1', 'sig2')
+
+    def __init__(self, path, resume=False, log=None):
+        self.path = path
+        self.records = dict()
+        if resume and os.path.exists(path):
+            with open(path) as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  ## partial line of an interrupted write
+                        continue
+                    self.records[record['src1']] = record
+            if log:
+                log.info(f'loaded {len(self.records)} results from journal: {path}')
+        self.fh = open(path, 'a' if resume else 'w')
+
+    def lookup(self, src1, src2, path1=None):
+        """return the recorded result of src1 when both files are unchanged since it was recorded
+            path1: Optional path to open src1, default: src1
+        """
+        record = self.records.get(src1)
+        if record and record['src2'] == src2 and record['sig1'] == stat_sig(path1 or src1) and record['sig2'] == stat_sig(src2):
+            return record
+        return None
+
+    def append(self, res):
+        self.fh.write(json.dumps({key: getattr(res, key) for key in self.fields}) + '\n')
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+
+class CompareResults:
+    """pair results accumulated column by column, exported to a DataFrame, csv, xlsx or parquet"""
+    columns = ('path1', 'path2', 'size1', 'size2', 'status', 'stage', 'offset', 'elapsed')
+    xlsx_max_rows = 1048575  ## excel sheet row limit excluding the header
+
+    def __init__(self):
+        self.data = {col: list() for col in self.columns}
+
+    def __len__(self):
+        return len(self.data['status'])
+
+    def append(self, res):
+        data = self.data
+        data['path1'].append(res.src1)
+        data['path2'].append(res.src2)
+        data['size1'].append(res.sig1[0] if res.sig1 else None)
+        data['size2'].append(res.sig2[0] if res.sig2 else None)
+        data['status'].append(res.status)
+        data['stage'].append(res.stage)
+        data['offset'].append(res.offset)
+        data['elapsed'].append(sum(res.timings.values()) / pow(10, 9))
+
+    def rows(self):
+        return zip(*(self.data[col] for col in self.columns))
+
+    def select(self, status, *cols):
+        """return the values of cols for the rows with status"""
+        return [row for row, st in zip(zip(*(self.data[col] for col in cols)), self.data['status']) if st == status]
+
+    def summary(self):
+        """return {status: count}"""
+        return dict(collections.Counter(self.data['status']))
+
+    def to_dataframe(self):
+        import pandas as pd
+        df = pd.DataFrame(self.data, columns=list(self.columns))
+        df['status'] = df['status'].astype('category')
+        for col in ('size1', 'size2', 'offset'):  ## nullable ints, missing values would turn them to floats
+            df[col] = df[col].astype('Int64')
+        return df
+
+    def export(self, filename):
+        """write results to filename, the format is selected by the suffix: .csv, .xlsx or .parquet"""
+        suffix = Path(filename).suffix
+        if suffix == '.csv':
+            import csv
+            with open(filename, 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(self.columns)
+                writer.writerows(self.rows())
+        elif suffix == '.xlsx':
+            self.export_xlsx(filename)
+        elif suffix == '.parquet':
+            self.to_dataframe().to_parquet(filename, index=False)
+        else:
+            raise ValueError(f'Invalid report file suffix: {suffix}, expected: .csv, .xlsx or .parquet')
+
+    def export_xlsx(self, filename):
+        """stream rows with the constant memory mode of xlsxwriter instead of building a workbook in memory,
+        results beyond the excel row limit continue on the next sheet
+        """
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        sheet = workbook.add_worksheet('summary')
+        sheet.write_row(0, 0, ('status', 'count'))
+        for r, item in enumerate(self.summary().items(), 1):
+            sheet.write_row(r, 0, item)
+        sheet = None
+        r = 0
+        for i, row in enumerate(self.rows()):
+            if i % self.xlsx_max_rows == 0:
+                sheet = workbook.add_worksheet(f'results{i // self.xlsx_max_rows}')
+                sheet.write_row(0, 0, self.columns)
+                r = 0
+            r += 1
+            sheet.write_row(r, 0, row)
+        workbook.close()
+
+
+class BufferedLog:
+    """log-like object that buffers records from a worker until they are flushed to the real log,
+    so the output of concurrent compares and diffs does not interleave
+    """
+    def __init__(self):
+        self.records = list()
+
+    def debug(self, msg):
+        self.records.append((logging.DEBUG, msg))
+
+    def info(self, msg):
+        self.records.append((logging.INFO, msg))
+
+    def flush(self, log):
+        for level, msg in self.records:
+            log.log(level, msg)
+        self.records.clear()
+
+
+def ordered_map(func, items, jobs=1, pool='thread', inflight=None):
+    """yield func(item) for each item in items order.
+    With jobs > 1 calls are run in a thread or process pool with at most {inflight} items
+    submitted ahead of the consumer, default: 4 * jobs
+    """
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    if pool == 'process':
+        import multiprocessing
+        ## fork so workers inherit the active CompareRun with its args, dir2 index and hash cache
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+    else:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+    inflight = inflight or 4 * jobs
+    pending = collections.deque()
+    with executor:
+        for item in items:
+            if len(pending) >= inflight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+def get_parser():
+    # arguments parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dir1',        '-d1',    help='Source dir #1, default: all files under current dir',  type=str)
+    parser.add_argument('--dir2',        '-d2',    help='Source dir #2',  type=str)
+    parser.add_argument('--match_path',  '-mp',    help='Match relative paths to files from dir1 & dir2',  action='store_true')
+    parser.add_argument('--lookup',      '-lk',    help='Method to locate files in dir2 when --match_path is not set. Default: index',  type=str, choices=['index', 'find'], default='index')
+    parser.add_argument('--index_file',  '-if',    help='Persist dir2 index to this file and reuse it while dir2 is unchanged',  type=str)
+    parser.add_argument('--tree_merge',  '-tmg',   help='Walk dir1 and dir2 together matching relative paths, also reporting files only in dir2',  action='store_true')
+    parser.add_argument('--tree_state',  '-ts',    help='Keep per dir digests of the identical subtrees of --tree_merge in this json file, unchanged ones are not compared again',  type=str)
+    parser.add_argument('--content_match', '-cm', help='Pair files by identical content irrespective of names to report moved, renamed and duplicated files',  action='store_true')
+    parser.add_argument('--limit',       '-lim',   help='Limit # files to compare',  type=int, default=0)
+    parser.add_argument('--diff',        '-di',    help='Select diff format. Default: disabled.',  type=str, choices=['context', 'unified', 'ndiff', 'html'])
+    parser.add_argument('--jobs',        '-j',     help='Number of parallel compare workers. Default: 1',  type=int, default=1)
+    parser.add_argument('--pool',        '-pl',    help='Worker pool type for --jobs. Default: thread',  type=str, choices=['thread', 'process'], default='thread')
+    parser.add_argument('--hash_cache',  '-hc',    help='Compare files by content digests cached in this sqlite file',  type=str)
+    parser.add_argument('--rehash',      '-rh',    help='Ignore cached digests and hash all files again',  action='store_true')
+    parser.add_argument('--journal',     '-jr',    help='Append each pair result to this JSONL file as soon as it is decided',  type=str)
+    parser.add_argument('--resume',      '-rs',    help='Skip pairs recorded in --journal whose files are unchanged',  action='store_true')
+    parser.add_argument('--async_log',   '-al',    help='Write the log from a background thread so compares never block on log writes',  action='store_true')
+    parser.add_argument('--profile',     '-pf',    help='Log timings of the discovery, lookup, compare and diff phases',  action='store_true')
+    parser.add_argument('--profile_json',  '-pj',  help='Write the --profile timings in ns to this json file',  type=str)
+    parser.add_argument('--cprofile',    '-cp',    help='Add cProfile stats of the main thread to the --profile report',  action='store_true')
+    parser.add_argument('--tracemalloc', '-tm',    help='Add top memory allocations to the --profile report',  action='store_true')
+    parser.add_argument('--report',      '-rp',    help='Export pair results to this .csv, .xlsx or .parquet file',  type=str)
+    parser.add_argument('--diff_report', '-dr',    help='Render the --diff of every different pair into this dir with an index.html, pages of unchanged pairs are reused. Default --diff: html',  type=str)
+    parser.add_argument('--serve',       '-sv',    help='Serve compares on this unix socket, keeping the config, dir2 indexes and hash caches warm between requests',  type=str)
+    parser.add_argument('--connect',     '-cn',    help='Run the compare in the --serve server listening on this unix socket',  type=str)
+    parser.add_argument('--debug',       '-dbg',   help='Debug mode',  action='store_true')
+    return parser
+
+
+def parse_args(parser, argv=None):
+    args = parser.parse_args(argv)
+    if args.resume and not args.journal:
+        parser.error('--resume requires --journal')
+    if args.resume and args.content_match:
+        parser.error('--resume is not supported with --content_match, use --hash_cache to skip hashing unchanged files')
+    if args.tree_state and not args.tree_merge:
+        parser.error('--tree_state requires --tree_merge')
+    if args.tree_merge and args.content_match:
+        parser.error('--tree_merge and --content_match are exclusive')
+    if args.serve and args.connect:
+        parser.error('--serve and --connect are exclusive')
+    args.profile = args.profile or bool(args.profile_json or args.cprofile or args.tracemalloc)
+    return args
+
+
+## config options with one item per line instead of comma separated
+line_list_options = ('ignore_lines',)
+
+
+def load_config(cwd=None, log=None):
+    """return the 'default' section of the compare_files.ini config files as {option: list of values}"""
+    ## config file candidates are read in order with latest file options with highest priority
+    ## base config file from script dir
+    config_files = [Path(__file__).with_suffix('.ini')]
+    ## next higer priority config file from home directory
+    homedir = os.getenv('HOME', '')
+    if homedir:
+       config_files.append(Path(homedir) / 'compare_files.ini')
+    ## next higher priority config file from cwd
+    cwd = Path(cwd) if cwd else Path.cwd()
+    config_files.append(cwd / 'compare_files.ini')
+
+    config_files = [str(x) for x in config_files]  ## convert to strs
+    if log:
+        log.debug(f'config_files: {config_files}')
+
+    import configparser
+    config = configparser.ConfigParser(interpolation=None)  ## ignore_lines regexes can contain %
+    with open(config_files[0]) as cf:
+        config.read_file(cf)
+    ## config.read() automatically ignores the files that do not exist
+    if len(config_files) > 1:
+        config.read(config_files[1:])
+
+    ## get config from 'default' section and convert items to list, regexes can contain ',' so they are one per line
+    config = dict(config['default'])
+    for key in config:
+        config[key] = config[key].split('\n' if key in line_list_options else ',')
+    return config
+
+
+class CompareSession:
+    """compare dir1 with dir2 any number of times with the config loaded once.
+    dir2 indexes and hash caches are kept in memory between runs, an index is rescanned when
+    the mtime of a dir under dir2 changed and cached digests are revalidated by file stats.
+        config: Optional {option: list of values}, default: load_config() of the cwd
+        log: Optional logger
+    Usage:
+        session = CompareSession(log=log)
+        results = session.run(parse_args(get_parser(), ['--dir2', dir2]))
+        session.close()
+    """
+    def __init__(self, config=None, log=None):
+        self.log = log or logging.getLogger(__name__)
+        self.config = config if config is not None else load_config(log=self.log)
+        self.log.info(self.config)
+        self.normalizer = Normalizer.from_config(self.config)
+        self.dir2_indexes = dict()  ## (dir2, abspath of dir2, index_file) => DirIndex
+        self.hash_caches = dict()   ## (abspath of db_file, table) => HashCache
+
+    def dir2_index(self, dir2, index_file=None):
+        key = (dir2, os.path.abspath(dir2), index_file)
+        index = self.dir2_indexes.get(key)
+        if index and index.is_valid():
+            self.log.info(f'reusing index of {dir2}')
+            return index
+        index = self.dir2_indexes[key] = DirIndex(dir2, index_file=index_file, log=self.log)
+        return index
+
+    def hash_cache(self, db_file, rehash=False, table='files', digest_func=None):
+        """return the warm HashCache of table in db_file, db_file None keeps it in memory for the session"""
+        key = (os.path.abspath(db_file) if db_file else None, table)
+        cache = self.hash_caches.get(key)
+        if not cache:
+            cache = self.hash_caches[key] = HashCache(db_file, log=self.log, table=table, digest_func=digest_func)
+        cache.rehash = rehash
+        return cache
+
+    def run(self, args, profiler=None):
+        """compare dir1 with dir2 as selected by args of parse_args(), return CompareResults.
+            profiler: Optional started pyutils.Profiler, it is stopped and reported at the end of the run
+        """
+        global _active_run
+        log = self.log
+        if not profiler:
+            profiler = pyutils.Profiler(enabled=args.profile, cprofile=args.cprofile, tracemalloc=args.tracemalloc)
+            profiler.start()
+        run = _active_run = CompareRun(self, args, profiler)
+        results = CompareResults()
+        includes, excludes = compile_includes(self.config['rglob_includes']), compile_excludes(self.config['rglob_excludes'])
+
+        ## src1 paths are discovered lazily so comparing starts before the walk of dir1 completes
+        src1_iter = profiler.iter('discovery', iter_files(run.dir1, includes=includes, excludes=excludes))
+        if args.limit:
+           src1_iter = itertools.islice(src1_iter, args.limit)
+
+        if args.content_match:
+           src1_paths = list(src1_iter)
+           with profiler.timer('index'):
+              src2_paths = list(iter_files(args.dir2, includes=includes, excludes=excludes))
+           with profiler.timer('compare'):
+              content_matches = match_content(src1_paths, src2_paths, hash_cache=run.hash_cache, jobs=args.jobs, log=log)
+           results_iter = (run.content_result(src1, *content_matches[src1]) for src1 in src1_paths)
+        elif args.tree_merge:
+           with profiler.timer('discovery'):
+              tree = TreeMerge(run.dir1, args.dir2, includes=includes, excludes=excludes, state_file=args.tree_state,
+                               key=[self.config['rglob_includes'], self.config['rglob_excludes'], run.normalizer and run.normalizer.key], log=log)
+           pairs = tree.pairs[:args.limit] if args.limit else tree.pairs
+           results_iter = itertools.chain(
+              (Result('equal', rel, path2, 'tree', None, None, stat_sig(path1, st1), stat_sig(path2, st2), BufferedLog(), [], {})
+               for rel, path1, path2, st1, st2 in tree.pruned),
+              ordered_map(_compare_pair_active, pairs, jobs=args.jobs, pool=args.pool),
+              (Result('not_found', rel, None, None, None, None, stat_sig(path1, st1), None, BufferedLog(), [], {})
+               for rel, path1, st1 in tree.only1),
+              (Result('only_dir2', None, path2, None, None, None, None, stat_sig(path2, st2), BufferedLog(), [], {})
+               for rel, path2, st2 in tree.only2))
+        else:
+           results_iter = ordered_map(_compare_active, src1_iter, jobs=args.jobs, pool=args.pool)
+
+        ## results and their logs are consumed in src1 discovery order irrespective of --jobs
+        stages = collections.Counter()
+        pages = list()
+        for res in results_iter:
+           res.log.flush(log)
+           ## forked workers update copies of the caches, their digests and hits are added to the caches here
+           if run.hash_cache and run.forked:
+              run.hash_cache.merge(res.digests)
+              run.hash_cache.hits += res.hits
+           if run.norm_cache and run.forked:
+              run.norm_cache.merge(res.fingerprints)
+              run.norm_cache.hits += res.fingerprint_hits
+           if res.stage:
+              stages[res.stage] += 1
+           for phase, duration_ns in res.timings.items():
+              profiler.record(phase, duration_ns)
+           profiler.count(f'files {res.status}')
+           if run.journal and res.stage != 'journal':
+              run.journal.append(res)
+           if res.page:
+              pages.append(res.page)
+           results.append(res)
+
+        files_equal = [f'{path2}  {path1}' for path1, path2 in results.select('equal', 'path1', 'path2')]
+        files_diff = [f'{path2}  {path1}' for path1, path2 in results.select('different', 'path1', 'path2')]
+        files_not_found = [path1 for path1, in results.select('not_found', 'path1')]
+        log.info(f'compared {len(results)} files ...')
+        log.info('files equal: {} {}\n'.format(len(files_equal), pyutils.to_str(files_equal)))
+        if run.normalizer:
+           files_equivalent = [f'{path2}  {path1}' for path1, path2 in results.select('equivalent', 'path1', 'path2')]
+           log.info('files equivalent: {} {}\n'.format(len(files_equivalent), pyutils.to_str(files_equivalent)))
+        log.info('files different: {} {}\n'.format(len(files_diff), pyutils.to_str(files_diff)))
+        log.info('files not found: {} {}\n'.format(len(files_not_found), pyutils.to_str(files_not_found)))
+        if args.content_match:
+           files_moved = [f'{path2}  {path1}' for path1, path2 in results.select('moved', 'path1', 'path2') + results.select('renamed', 'path1', 'path2')]
+           log.info('files moved or renamed: {} {}\n'.format(len(files_moved), pyutils.to_str(files_moved)))
+           matched2 = set(itertools.chain.from_iterable(matches for _, matches in content_matches.values()))
+           only2 = [path for path in src2_paths if path not in matched2]
+           log.info('dir2 files without same content in dir1: {} {}\n'.format(len(only2), pyutils.to_str(only2)))
+        if args.tree_merge:
+           files_only2 = [path2 for path2, in results.select('only_dir2', 'path2')]
+           log.info('files only in dir2: {} {}\n'.format(len(files_only2), pyutils.to_str(files_only2)))
+        log.info('results by status: {}'.format(', '.join(f'{k}: {v}' for k, v in results.summary().items())))
+        log.info('pairs settled by compare stage: {}'.format(', '.join(f'{k}: {v}' for k, v in stages.items())))
+
+        if run.hash_cache:
+           with profiler.timer('hash_cache_save'):
+              run.hash_cache.save()
+        if run.norm_cache:
+           run.norm_cache.save()
+        if run.journal:
+           run.journal.close()
+        if args.tree_state and not args.limit:  ## with --limit the outcome of the pairs over the limit is unknown
+           data = results.data
+           tree.save([path1 or os.path.relpath(path2, args.dir2)
+                      for path1, path2, status in zip(data['path1'], data['path2'], data['status']) if status != 'equal'])
+        if run.diff_report:
+           run.diff_report.save(pages)
+        if args.report:
+           results.export(args.report)
+           log.info(f'report: {args.report}')
+
+        if args.profile:
+           profiler.stop()
+           log.info(profiler.report())
+           if args.profile_json:
+              with open(args.profile_json, 'w') as fh:
+                 json.dump(profiler.to_dict(), fh, indent=2)
+        _active_run = None
+        return results
+
+    def close(self):
+        self.dir2_indexes.clear()
+        self.hash_caches.clear()
+
+
+class CompareRun:
+    """state of a single CompareSession.run(), compare_src() runs in the workers"""
+    def __init__(self, session, args, profiler):
+        self.args = args
+        self.forked = args.pool == 'process' and args.jobs > 1  ## ordered_map runs jobs=1 inline
+        self.dir1 = Path(args.dir1) if args.dir1 else Path.cwd()
+        self.dir2_index = None
+        if not (args.match_path or args.content_match or args.tree_merge) and args.lookup == 'index':
+           with profiler.timer('index'):
+              self.dir2_index = session.dir2_index(args.dir2, index_file=args.index_file)
+        self.hash_cache = None
+        if args.hash_cache:
+           with profiler.timer('hash_cache_load'):
+              self.hash_cache = session.hash_cache(args.hash_cache, rehash=args.rehash)
+        self.journal = Journal(args.journal, resume=args.resume, log=session.log) if args.journal else None
+        self.normalizer = session.normalizer
+        self.norm_cache = None
+        if self.normalizer:
+           ## normalized fingerprints of different files, persisted with --hash_cache
+           self.norm_cache = session.hash_cache(args.hash_cache, rehash=args.rehash, table=f'normalized_{self.normalizer.key}',
+                                                digest_func=self.normalizer.fingerprint)
+        self.diff_report = None
+        if args.diff_report:
+           import diff
+           self.diff_report = diff.DiffReport(args.diff_report, fmt=args.diff or 'html', log=session.log)
+
+    def compare_src(self, src1):
+       """locate src1 in dir2 and compare them, return Result"""
+       args = self.args
+       wlog = BufferedLog()
+       digests = list()
+       timings = dict()  ## phase => ns, recorded into the profiler by the consumer so it works across processes
+       start_ns = time.perf_counter_ns()
+       src2 = None
+       src2_path = None
+       path1 = os.path.relpath(src1)  ## src1 is reported relative to dir1 but opened relative to the cwd
+       dir1_str = str(self.dir1) + '/'
+       if src1.startswith(dir1_str):
+           src1 = pyutils.remove_prefix(prefix=dir1_str, text=src1)
+
+       if args.match_path: ## use same relative paths to files
+          src2_path = Path(args.dir2, src1)
+          if(src2_path.is_file()):
+            src2 = str(src2_path)
+       elif self.dir2_index: # use dir2 index to locate file by name anywhere under dir2
+          src2_path = src1 ## default to src1 for "not found" reporting
+          matches = self.dir2_index.lookup(src1)
+          if matches:
+              wlog.debug(f'found: {matches}')
+              if len(matches) > 1:
+                   ## use first match when multiple matches are found
+                   wlog.info(f'found multiple matches for: {src1}, found: {matches}')
+              src2 = matches[0]
+              src2_path = Path(src2)
+       else: # use find to locate file in anywhere under dir2
+          src2_path = src1 ## default to src1 for "not found" reporting
+          sh_cmds = ['find', args.dir2, f'-name "{os.path.basename(src1)}"']
+          sh_cmd_str =' '.join(sh_cmds)
+          wlog.debug('sh_cmd: {}'.format(sh_cmd_str))
+          import subprocess
+          proc = subprocess.Popen(sh_cmd_str, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+          out, err = proc.communicate()
+          out_lines = [line.strip() for line in out.decode().split('\n') if line.strip() != '']
+          if out_lines:
+              wlog.debug(f'found: {out_lines}')
+              if len(out_lines) > 1:
+                   ## use first match when multiple matches are found
+                   wlog.info(f'found multiple matches for: {src1}, found: {out_lines}')
+              src2 = out_lines[0]
+              src2_path = Path(src2)
+
+       timings['lookup'] = time.perf_counter_ns() - start_ns
+       return self.compare_found(src1, path1, src2, src2_path, wlog, digests, timings)
+
+    def compare_pair(self, pair):
+       """compare a (rel, path1, path2, st1, st2) pair of TreeMerge, return Result"""
+       rel, path1, path2, st1, st2 = pair
+       return self.compare_found(rel, os.path.relpath(path1), path2, path2, BufferedLog(), list(), dict(), st1, st2)
+
+    def compare_found(self, src1, path1, src2, src2_path, wlog, digests, timings, st1=None, st2=None):
+       """compare src1 opened at path1 with its dir2 match src2, None when not found, return Result"""
+       args = self.args
+       record = self.journal.lookup(src1, src2, path1) if args.resume else None
+       if record:
+          wlog.info(f'{src1} => {record["status"]} (resumed from journal)')
+          page = self.diff_pair(src1, path1, src2, wlog, timings) if self.diff_report and record['status'] == 'different' else None
+          return Result(record['status'], src1, src2, 'journal', record['offset'], record['blocks'],
+                        record['sig1'], record['sig2'], wlog, digests, timings, page)
+
+       if not src2:
+          wlog.info(f'{str(src2_path)} => file not found in dir2!')
+          return Result('not_found', src1, src2, None, None, None, stat_sig(path1), None, wlog, digests, timings)
+
+       start_ns = time.perf_counter_ns()
+       sig1, sig2 = stat_sig(path1, st1), stat_sig(src2, st2)
+       equal, stage, offset, blocks = staged_compare(path1, src2, self.hash_cache, digests, st1=st1, st2=st2)
+       timings['compare'] = time.perf_counter_ns() - start_ns
+       if equal:
+          wlog.info(f'{src1} => files are equal')
+          return Result('equal', src1, src2, stage, offset, blocks, sig1, sig2, wlog, digests, timings)
+
+       fingerprints = list()  ## fingerprints of non equivalent pairs are cached too, they are merged by the consumer
+       if self.normalizer and not (is_binary(path1) or is_binary(src2)):
+          start_ns = time.perf_counter_ns()
+          equivalent = self.norm_cache.digest(path1, fingerprints, st1) == self.norm_cache.digest(src2, fingerprints, st2)
+          timings['normalize'] = time.perf_counter_ns() - start_ns
+          if equivalent:
+             wlog.info(f'{src1} => files are equivalent after normalization')
+             return Result('equivalent', src1, src2, 'normalized', offset, blocks, sig1, sig2, wlog, digests, timings, None, fingerprints)
+
+       wlog.info(f'{src1} => files are different' + (f', first difference at byte: {offset}' if offset is not None else '')
+                 + (f', differing blocks: {blocks}' if blocks else ''))
+       page = self.diff_pair(src1, path1, src2, wlog, timings)
+       return Result('different', src1, src2, stage, offset, blocks, sig1, sig2, wlog, digests, timings, page, fingerprints)
+
+    def diff_pair(self, src1, path1, src2, wlog, timings):
+       """log the --diff of a different pair or render it into the --diff_report, return the report page entry"""
+       args = self.args
+       page = None
+       if not (args.diff or self.diff_report):
+           return page
+       if is_binary(path1) or is_binary(src2):
+           wlog.info(f'{src1} => binary files, skipping diff')
+           return page
+       start_ns = time.perf_counter_ns()
+       if self.diff_report:
+           page = self.diff_report.render(src1, path1, src2)
+           wlog.info(f'{src1} => diff page: {page["page"]}' + (' (reused)' if page['reused'] else ''))
+       else:
+           import diff
+           diff_args = diff.get_parser().parse_args([f'--{args.diff}', path1, src2])
+           diff.diff(args=diff_args, log=wlog)
+       timings['diff'] = time.perf_counter_ns() - start_ns
+       return page
+
+    def content_result(self, src1, stage, matches):
+       """return Result of src1 and its content matches in dir2, the match with the same relative path
+       is preferred over the one with the same basename"""
+       args = self.args
+       wlog = BufferedLog()
+       rel1 = os.path.relpath(src1, self.dir1)
+       if not matches:
+          src2 = os.path.join(args.dir2, rel1)
+          if os.path.isfile(src2):  ## same relative path with another content
+             wlog.info(f'{rel1} => files are different, no file with same content in dir2')
+             timings = dict()
+             page = self.diff_pair(rel1, src1, src2, wlog, timings)
+             return Result('different', rel1, src2, stage, None, None, stat_sig(src1), stat_sig(src2), wlog, [], timings, page)
+          wlog.info(f'{rel1} => no file with same content in dir2!')
+          return Result('not_found', rel1, None, stage, None, None, stat_sig(src1), None, wlog, [], {})
+       if len(matches) > 1:
+          wlog.info(f'{rel1} => content duplicated in dir2: {matches}')
+       by_path = [x for x in matches if os.path.relpath(x, args.dir2) == rel1]
+       by_name = [x for x in matches if os.path.basename(x) == os.path.basename(src1)]
+       if by_path:
+          status, src2 = 'equal', by_path[0]
+       elif by_name:
+          status, src2 = 'moved', by_name[0]
+       else:
+          status, src2 = 'renamed', matches[0]
+       wlog.info(f'{rel1} => {status}' + (f' to: {src2}' if status != 'equal' else ''))
+       return Result(status, rel1, src2, stage, None, None, stat_sig(src1), stat_sig(src2), wlog, [], {})
+
+
+## CompareRun of the running CompareSession.run(), forked process pool workers inherit it
+_active_run = None
+
+
+def _counted(compare, item):
+    """return the Result of compare(item) with the cache hits of a forked worker, which never reach the parent"""
+    run = _active_run
+    if not run.forked:
+        return compare(item)
+    caches = [run.hash_cache, run.norm_cache]
+    start = [cache.hits if cache else 0 for cache in caches]
+    res = compare(item)
+    hits, fingerprint_hits = [cache.hits - n if cache else 0 for cache, n in zip(caches, start)]
+    return res._replace(hits=hits, fingerprint_hits=fingerprint_hits)
+
+
+def _compare_active(src1):
+    return _counted(_active_run.compare_src, src1)
+
+
+def _compare_pair_active(pair):
+    return _counted(_active_run.compare_pair, pair)
+
+
+def serve(socket_path, session):
+    """serve compares on a unix socket with a single warm session, one json line per request and response:
+        request:  {"argv": [compare_files.py args], "cwd": cwd of the client}
+        response: {"summary": {status: count}} or {"error": message}
+    The session config is loaded once at server start. Requests run one at a time in the client cwd.
+    """
+    import socketserver, io, contextlib
+    log = session.log
+    parser = get_parser()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            response = dict()
+            stderr = io.StringIO()
+            try:
+                request = json.loads(self.rfile.readline())
+                os.chdir(request['cwd'])
+                with contextlib.redirect_stderr(stderr):
+                    args = parse_args(parser, request['argv'])
+                log.info(f'request: {request}')
+                response['summary'] = session.run(args).summary()
+            except SystemExit:  ## argparse error
+                response['error'] = stderr.getvalue().strip()
+            except Exception as e:
+                log.exception('request failed')
+                response['error'] = f'{type(e).__name__}: {e}'
+            self.wfile.write((json.dumps(response) + '\n').encode())
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        log.info(f'serving on: {socket_path}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def connect(socket_path, argv):
+    """send argv to the serve() server on socket_path, return its response"""
+    import socket
+    argv = list(argv)
+    for opt in ('--connect', '-cn'):  ## the server must not connect to itself
+        while opt in argv:
+            del argv[argv.index(opt):argv.index(opt) + 2]
+    argv = [x for x in argv if not x.startswith(('--connect=', '-cn='))]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile('rwb') as fh:
+            fh.write((json.dumps(dict(argv=argv, cwd=os.getcwd())) + '\n').encode())
+            fh.flush()
+            return json.loads(fh.readline())
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parse_args(parser, argv)
+    if args.connect:
+        response = connect(args.connect, sys.argv[1:] if argv is None else argv)
+        if 'error' in response:
+            sys.exit(response['error'])
+        print('results by status: {}'.format(', '.join(f'{k}: {v}' for k, v in response['summary'].items())))
+        return
+
+    profiler = pyutils.Profiler(enabled=args.profile, cprofile=args.cprofile, tracemalloc=args.tracemalloc)
+    profiler.start()
+    log = pyutils.init_logger(name=__name__, script=__file__, debug=args.debug, queue=args.async_log)
+    session = CompareSession(log=log)
+    if args.serve:
+        serve(args.serve, session)
+    else:
+        session.run(args, profiler=profiler)
+    session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,15 @@
 * unified:  highlights clusters of changes in an inline format.
 * html:     generates side by side comparison with change highlights.
 
+context and unified diffs can use the linear space Myers O(ND) algorithm (--algorithm myers)
+instead of difflib's SequenceMatcher, which is much faster on large files with few changes.
+They can also be streamed (--stream) holding only a window of lines in memory.
+DiffReport renders the diffs of many file pairs into a browsable html bundle with an index page.
+
 Adapted from: https://docs.python.org/3/library/difflib.html#a-command-line-interface-to-difflib
 """
 
-import sys, os, difflib, argparse, itertools
-from datetime import datetime, timezone
+import sys, os, argparse, itertools, collections
 
 import pyutils
 
@@ -18,6 +22,9 @@ import pyutils
 default_lines  = 3
 default_maxdiff = 100
 default_context = False
+default_algorithm = 'difflib'
+default_window = 1000
+default_max_cost = 256
 
 
 def get_parser():
@@ -35,43 +42,690 @@ def get_parser():
                         help=f'Set number of context lines (default: {default_lines})')
     parser.add_argument('--maxdiff', '-md', type=int, default=default_maxdiff,
                         help=f'Set number of context lines (default: {default_maxdiff})')
+    parser.add_argument('--algorithm', '-a', choices=['difflib', 'myers'], default=default_algorithm,
+                        help=f'Diff algorithm for context and unified diffs (default: {default_algorithm})')
+    parser.add_argument('--check', action='store_true', default=False,
+                        help='Verify the diff hunks apply cleanly to fromfile and produce tofile')
+    parser.add_argument('--stream', '-s', action='store_true', default=False,
+                        help='Stream context or unified diff reading the files only up to --maxdiff lines of output')
+    parser.add_argument('--window', '-w', type=int, default=default_window,
+                        help=f'Max # of lines held per file to resync a change in --stream mode (default: {default_window})')
     ## required args - input files
     parser.add_argument('fromfile')
     parser.add_argument('tofile')
     return parser
 
 
+def __getattr__(name):
+    """PEP 562: difflib and datetime are imported on first use only, myers and stream diffs never need difflib"""
+    if name in ('difflib', 'HtmlDiff'):
+        import difflib
+        return difflib if name == 'difflib' else difflib.HtmlDiff
+    if name in ('datetime', 'timezone'):
+        import datetime
+        return getattr(datetime, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 def file_mtime(path):
+    from datetime import datetime, timezone
     t = datetime.fromtimestamp(os.stat(path).st_mtime,
                                timezone.utc)
     return t.astimezone().isoformat()
 
 
+def _myers_split(a, alo, ahi, b, blo, bhi, max_cost=default_max_cost):
+    """return (x, y) point on the middle snake of the shortest edit script of a[alo:ahi] and b[blo:bhi]
+    found by searching forward and backward in linear space, None when there is no common element.
+    After max_cost edits in each direction the search gives up on the shortest script and returns the
+    furthest reaching point of either direction instead, as GNU diff does when a diff is too expensive.
+    Adapted from the bisect of diff-match-patch: https://github.com/google/diff-match-patch
+    """
+    len1, len2 = ahi - alo, bhi - blo
+    max_d = (len1 + len2 + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2 = v1[:]
+    delta = len1 - len2
+    front = delta % 2 != 0  ## odd delta => paths overlap on a forward step
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < len1 and y1 < len2 and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > len1:
+                k1end += 2
+            elif y1 > len2:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    if x1 >= len1 - v2[k2_offset]:
+                        return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < len1 and y2 < len2 and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > len1:
+                k2end += 2
+            elif y2 > len2:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= len1 - x2:
+                        return x1, v_offset + x1 - k1_offset
+        if d + 1 >= max_cost:
+            return _myers_furthest(v1, v2, v_offset, d, len1, len2)
+    return None
+
+
+def _myers_furthest(v1, v2, v_offset, d, len1, len2):
+    """return the point furthest from its start on the forward (v1) and backward (v2) paths
+    of a search stopped after d edits, None when no path left its start"""
+    best, point = 0, None
+    for k in range(-d, d + 1, 2):
+        x1, x2 = v1[v_offset + k], v2[v_offset + k]
+        if 0 <= x1 <= len1 and 0 <= x1 - k <= len2 and x1 + x1 - k > best:
+            best, point = x1 + x1 - k, (x1, x1 - k)
+        if 0 <= x2 <= len1 and 0 <= x2 - k <= len2 and x2 + x2 - k > best:
+            best, point = x2 + x2 - k, (len1 - x2, len2 - x2 + k)
+    if point in ((0, 0), (len1, len2)):
+        return None
+    return point
+
+
+def myers_opcodes(a, b, max_cost=default_max_cost):
+    """return the list of (tag, i1, i2, j1, j2) opcodes turning a into b, same as
+    difflib.SequenceMatcher.get_opcodes(), computed with the Myers O(ND) algorithm in linear space.
+    Searches are capped at max_cost edits so very different inputs take O(N * max_cost) time,
+    the opcodes are then valid but not always minimal.
+    """
+    ## compare lines as ints
+    ids = dict()
+    a = [ids.setdefault(x, len(ids)) for x in a]
+    b = [ids.setdefault(x, len(ids)) for x in b]
+
+    blocks = list()  ## matching (i, j, size) blocks
+    stack = [(0, len(a), 0, len(b))]  ## explicit stack instead of recursion
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        ## common prefix and suffix
+        i, j = alo, blo
+        while i < ahi and j < bhi and a[i] == b[j]:
+            i += 1
+            j += 1
+        if i > alo:
+            blocks.append((alo, blo, i - alo))
+        alo, blo = i, j
+        i, j = ahi, bhi
+        while i > alo and j > blo and a[i - 1] == b[j - 1]:
+            i -= 1
+            j -= 1
+        if i < ahi:
+            blocks.append((i, j, ahi - i))
+        ahi, bhi = i, j
+        if alo == ahi or blo == bhi:
+            continue
+        split = _myers_split(a, alo, ahi, b, blo, bhi, max_cost)
+        if split:
+            x, y = split
+            stack.append((alo + x, ahi, blo + y, bhi))
+            stack.append((alo, alo + x, blo, blo + y))
+    blocks.sort()
+
+    opcodes = list()
+    i = j = 0
+    for ai, bj, size in blocks + [(len(a), len(b), 0)]:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            if opcodes and opcodes[-1][0] == 'equal':  ## merge adjacent blocks
+                opcodes[-1] = ('equal', opcodes[-1][1], i, opcodes[-1][3], j)
+            else:
+                opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def group_opcodes(opcodes, n=3):
+    """yield groups of opcodes with up to n lines of context, same as
+    difflib.SequenceMatcher.get_grouped_opcodes() but for any iterable of opcodes
+    """
+    nn = n + n
+    group = list()
+    opcodes = iter(opcodes)
+    code = next(opcodes, None)
+    first = True
+    while code is not None:
+        next_code = next(opcodes, None)
+        tag, i1, i2, j1, j2 = code
+        if tag == 'equal':
+            if first:
+                i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+            if next_code is None:
+                i2, j2 = min(i2, i1 + n), min(j2, j1 + n)
+            if i2 - i1 > nn:  ## end the group and start next group with n lines of context
+                group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+                yield group
+                group = list()
+                i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+        code = next_code
+        first = False
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range_unified(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f'{beginning}'
+    if not length:
+        beginning -= 1  ## empty ranges begin at line just before the range
+    return f'{beginning},{length}'
+
+
+def _format_range_context(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if not length:
+        beginning -= 1
+    if length <= 1:
+        return f'{beginning}'
+    return f'{beginning},{beginning + length - 1}'
+
+
+def unified_diff(a, b, groups, fromfile='', tofile='', fromfiledate='', tofiledate='', lineterm='\n'):
+    """difflib.unified_diff() output from opcode groups, see group_opcodes()"""
+    started = False
+    for group in groups:
+        if not started:
+            started = True
+            fromdate = f'\t{fromfiledate}' if fromfiledate else ''
+            todate = f'\t{tofiledate}' if tofiledate else ''
+            yield f'--- {fromfile}{fromdate}{lineterm}'
+            yield f'+++ {tofile}{todate}{lineterm}'
+        first, last = group[0], group[-1]
+        yield f'@@ -{_format_range_unified(first[1], last[2])} +{_format_range_unified(first[3], last[4])} @@{lineterm}'
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in {'replace', 'delete'}:
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in {'replace', 'insert'}:
+                for line in b[j1:j2]:
+                    yield '+' + line
+
+
+def context_diff(a, b, groups, fromfile='', tofile='', fromfiledate='', tofiledate='', lineterm='\n'):
+    """difflib.context_diff() output from opcode groups, see group_opcodes()"""
+    prefix = dict(insert='+ ', delete='- ', replace='! ', equal='  ')
+    started = False
+    for group in groups:
+        if not started:
+            started = True
+            fromdate = f'\t{fromfiledate}' if fromfiledate else ''
+            todate = f'\t{tofiledate}' if tofiledate else ''
+            yield f'*** {fromfile}{fromdate}{lineterm}'
+            yield f'--- {tofile}{todate}{lineterm}'
+        first, last = group[0], group[-1]
+        yield '***************' + lineterm
+        yield f'*** {_format_range_context(first[1], last[2])} ****{lineterm}'
+        if any(tag in {'replace', 'delete'} for tag, _, _, _, _ in group):
+            for tag, i1, i2, _, _ in group:
+                if tag != 'insert':
+                    for line in a[i1:i2]:
+                        yield prefix[tag] + line
+        yield f'--- {_format_range_context(first[3], last[4])} ----{lineterm}'
+        if any(tag in {'replace', 'insert'} for tag, _, _, _, _ in group):
+            for tag, _, _, j1, j2 in group:
+                if tag != 'delete':
+                    for line in b[j1:j2]:
+                        yield prefix[tag] + line
+
+
+def apply_unified(a, diff_lines):
+    """apply unified diff hunks to lines a and return the patched lines,
+    raise ValueError when a hunk does not match a
+    """
+    import re
+    hunk_re = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+    out = list()
+    pos = 0
+    for line in diff_lines:
+        if line.startswith('--- ') or line.startswith('+++ '):
+            continue
+        match = hunk_re.match(line)
+        if match:
+            start, length = int(match.group(1)), match.group(2)
+            start = start if length == '0' else start - 1  ## empty ranges point at the line before
+            if start < pos:
+                raise ValueError(f'overlapping hunk: {line.strip()}')
+            out.extend(a[pos:start])
+            pos = start
+        elif line[:1] in (' ', '-'):
+            if pos >= len(a) or a[pos] != line[1:]:
+                raise ValueError(f'hunk line {pos + 1} does not match: {line[1:]!r}')
+            if line[0] == ' ':
+                out.append(a[pos])
+            pos += 1
+        elif line[:1] == '+':
+            out.append(line[1:])
+        else:
+            raise ValueError(f'invalid diff line: {line!r}')
+    out.extend(a[pos:])
+    return out
+
+
+def trimmed_opcodes(a, b, get_opcodes):
+    """return opcodes of a and b, running get_opcodes(a, b) only on the lines between
+    the common leading and trailing lines, with the line numbers shifted back
+    """
+    size = min(len(a), len(b))
+    head = 0
+    while head < size and a[head] == b[head]:
+        head += 1
+    tail = 0
+    while tail < size - head and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    opcodes = [('equal', 0, head, 0, head)] if head else []
+    for tag, i1, i2, j1, j2 in get_opcodes(a[head:len(a) - tail], b[head:len(b) - tail]):
+        opcodes.append((tag, i1 + head, i2 + head, j1 + head, j2 + head))
+    if tail:
+        opcodes.append(('equal', len(a) - tail, len(a), len(b) - tail, len(b)))
+    ## merge the equal opcodes around the trimmed lines
+    merged = list()
+    for code in opcodes:
+        if merged and code[0] == merged[-1][0] == 'equal':
+            merged[-1] = ('equal', merged[-1][1], code[2], merged[-1][3], code[4])
+        else:
+            merged.append(code)
+    return merged
+
+
+def files_identical(fromfile, tofile, chunk_size=1 << 20):
+    """byte-identical check by size and then contents, without splitting lines.
+    Contents are compared chunk by chunk so it stops at the first differing chunk.
+    """
+    if os.stat(fromfile).st_size != os.stat(tofile).st_size:
+        return False
+    with open(fromfile, 'rb') as ff, open(tofile, 'rb') as tf:
+        while True:
+            chunk = ff.read(chunk_size)
+            if chunk != tf.read(chunk_size):
+                return False
+            if not chunk:
+                return True
+
+
+def check_diff(a, b, opcodes, n=3):
+    """verify the unified hunks of opcodes apply cleanly to a and produce b"""
+    patched = apply_unified(a, unified_diff(a, b, group_opcodes(opcodes, n)))
+    if patched != b:
+        raise ValueError('diff hunks applied to fromfile do not produce tofile')
+
+
+class _LineReader:
+    """line iterator of an open file with pushback, tracking the line number of the next line"""
+    def __init__(self, fh):
+        self.fh = fh
+        self.pushed = list()  ## pushed back lines in reverse order
+        self.lineno = 0
+
+    def readline(self):
+        if self.pushed:
+            line = self.pushed.pop()
+        else:
+            line = self.fh.readline()
+            if not line:
+                return None
+        self.lineno += 1
+        return line
+
+    def read(self, count):
+        lines = list()
+        while len(lines) < count:
+            line = self.readline()
+            if line is None:
+                break
+            lines.append(line)
+        return lines
+
+    def pushback(self, lines):
+        self.pushed.extend(reversed(lines))
+        self.lineno -= len(lines)
+
+    def at_eof(self):
+        line = self.readline()
+        if line is None:
+            return True
+        self.pushback([line])
+        return False
+
+
+class _HunkLines:
+    """lines of the current hunk, sliced with absolute line numbers by the diff formatters"""
+    def __init__(self):
+        self.start = 0
+        self.lines = list()
+
+    def __getitem__(self, key):
+        return self.lines[key.start - self.start:key.stop - self.start]
+
+
+def _stream_groups(fa, fb, a, b, n=3, window=default_window):
+    """yield opcode groups of the diff of open files fa and fb, one hunk at a time, and load the
+    lines of each hunk into a and b _HunkLines before it is yielded.
+    Common lines are skipped keeping only n lines of context, then up to {window} lines of each file
+    are diffed to find the next run of > 2n identical lines which closes the hunk. Changes longer
+    than the window are split into adjacent hunks, which still apply cleanly but may not be minimal.
+    """
+    ra, rb = _LineReader(fa), _LineReader(fb)
+    before = collections.deque(maxlen=n)  ## leading context of the next hunk
+    while True:
+        line_a, line_b = ra.readline(), rb.readline()
+        if line_a is None and line_b is None:
+            return
+        if line_a == line_b:
+            before.append(line_a)
+            continue
+        ra.pushback([line_a] if line_a is not None else [])
+        rb.pushback([line_b] if line_b is not None else [])
+
+        a_start, b_start = ra.lineno, rb.lineno
+        wa, wb = ra.read(window), rb.read(window)
+        eof = ra.at_eof() and rb.at_eof()
+        opcodes = myers_opcodes(wa, wb)
+        cut = None
+        for k, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+            if tag == 'equal' and i2 - i1 > 2 * n:
+                cut = k
+                break
+        if cut is not None:  ## close the hunk with n lines of the identical run
+            tag, i1, i2, j1, j2 = opcodes[cut]
+            opcodes = opcodes[:cut] + [('equal', i1, i1 + n, j1, j1 + n)] if n else opcodes[:cut]
+            ra.pushback(wa[i1 + n:])
+            rb.pushback(wb[j1 + n:])
+        elif eof and opcodes[-1][0] == 'equal':  ## trailing context at the end of files
+            tag, i1, i2, j1, j2 = opcodes[-1]
+            opcodes[-1] = ('equal', i1, min(i2, i1 + n), j1, min(j2, j1 + n))
+
+        context = len(before)
+        a.start, a.lines = a_start - context, list(before) + wa
+        b.start, b.lines = b_start - context, list(before) + wb
+        group = [('equal', a_start - context, a_start, b_start - context, b_start)] if context else []
+        group.extend((tag, a_start + i1, a_start + i2, b_start + j1, b_start + j2)
+                     for tag, i1, i2, j1, j2 in opcodes)
+        yield group
+        ## hunks split by the window must not share context lines
+        before = collections.deque(maxlen=n)
+
+
+def stream_diff(fromfile, tofile, fromdate='', todate='', n=3, window=default_window, unified=True):
+    """lazily yield unified or context diff lines of fromfile and tofile with bounded memory,
+    files are read only as far as the consumed output requires
+    """
+    a, b = _HunkLines(), _HunkLines()
+    format_diff = unified_diff if unified else context_diff
+    with open(fromfile) as fa, open(tofile) as fb:
+        yield from format_diff(a, b, _stream_groups(fa, fb, a, b, n=n, window=window),
+                               fromfile, tofile, fromdate, todate)
+
+
+report_css = """
+body { font-family: sans-serif; font-size: 13px; }
+table.diff, table.index { border-collapse: collapse; font-family: monospace; }
+table.index th { cursor: pointer; background: #eee; }
+table.index td, table.index th { border: 1px solid #ccc; padding: 2px 6px; }
+td.num { text-align: right; }
+.diff_header { background-color: #e0e0e0; }
+td.diff_header { text-align: right; }
+.diff_next { background-color: #c0c0c0; }
+.diff_add, .add { background-color: #aaffaa; }
+.diff_chg, .chg { background-color: #ffff77; }
+.diff_sub, .sub { background-color: #ffaaaa; }
+.hunk { color: #808; }
+pre span { display: block; }
+"""
+
+report_js = """
+// sort the index by the clicked column and filter its rows by the text typed in #filter
+function sortIndex(th) {
+  const table = th.closest('table'), col = th.cellIndex, body = table.tBodies[0];
+  const asc = th.dataset.asc !== 'true';
+  th.dataset.asc = asc;
+  const key = (tr) => { const td = tr.cells[col]; return td.classList.contains('num') ? Number(td.textContent) : td.textContent; };
+  Array.from(body.rows).sort((r1, r2) => (key(r1) > key(r2) ? 1 : key(r1) < key(r2) ? -1 : 0) * (asc ? 1 : -1))
+    .forEach((tr) => body.appendChild(tr));
+}
+function filterIndex(text) {
+  for (const tr of document.querySelectorAll('table.index tbody tr'))
+    tr.style.display = tr.textContent.includes(text) ? '' : 'none';
+}
+"""
+
+_report_page = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<link rel="stylesheet" href="{root}diff.css"><script src="{root}diff.js"></script></head>
+<body>
+{body}
+</body></html>
+"""
+
+
+class DiffReport:
+    """html bundle of diffs in report_dir: shared diff.css and diff.js, one page per file pair under pages/
+    and index.html listing every pair with its size and change statistics.
+    Pages are reused while both files and the report options are unchanged, as recorded in manifest.json.
+        fmt: html side by side tables, or unified, context or ndiff text diffs
+        lines: # of context lines
+    render() only writes the page of its pair so it can run in worker threads or forked processes,
+    save() writes the index and manifest of the entries returned by render().
+    """
+    version = 1
+    line_classes = {'+': 'add', '-': 'sub', '!': 'chg', '@': 'hunk', '*': 'hunk', '?': 'hunk'}
+    html_max_replace = 200 * 200  ## HtmlDiff is cubic in the size of a replaced block, larger ones get unified pages
+
+    def __init__(self, report_dir, fmt='html', lines=default_lines, log=None):
+        import json
+        self.report_dir = report_dir
+        self.fmt = fmt
+        self.lines = lines
+        self.log = log
+        self.options = dict(version=self.version, fmt=fmt, lines=lines)
+        self.manifest = dict()  ## name => entry of the previous run
+        os.makedirs(os.path.join(report_dir, 'pages'), exist_ok=True)
+        try:
+            with open(os.path.join(report_dir, 'manifest.json')) as fh:
+                data = json.load(fh)
+            if data['options'] == self.options:
+                self.manifest = data['entries']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def stat(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def page_name(self, name):
+        import hashlib
+        digest = hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+        return f'pages/{os.path.basename(name)}-{digest}.html'
+
+    def render(self, name, fromfile, tofile):
+        """write the diff page of fromfile and tofile unless the page of the previous run is still valid,
+        return its entry: name, fromfile, tofile, page, sig1, sig2, size1, size2, added, removed, reused
+        """
+        sig1, sig2 = self.stat(fromfile), self.stat(tofile)
+        entry = self.manifest.get(name)
+        if (entry and [entry['fromfile'], entry['tofile'], entry['sig1'], entry['sig2']] == [fromfile, tofile, sig1, sig2]
+                and os.path.exists(os.path.join(self.report_dir, entry['page']))):
+            return dict(entry, reused=True)
+
+        with open(fromfile, errors='replace') as ff:
+            fromlines = ff.readlines()
+        with open(tofile, errors='replace') as tf:
+            tolines = tf.readlines()
+        ## stats from the cost capped Myers opcodes, also used by the unified and context pages
+        opcodes = trimmed_opcodes(fromlines, tolines, myers_opcodes)
+        added = sum(j2 - j1 for tag, i1, i2, j1, j2 in opcodes if tag in ('insert', 'replace'))
+        removed = sum(i2 - i1 for tag, i1, i2, j1, j2 in opcodes if tag in ('delete', 'replace'))
+        page = self.page_name(name)
+        with open(os.path.join(self.report_dir, page), 'w') as fh:
+            fh.write(self.page(name, fromfile, tofile, fromlines, tolines, opcodes))
+        return dict(name=name, fromfile=fromfile, tofile=tofile, page=page, sig1=sig1, sig2=sig2,
+                    size1=sig1[0], size2=sig2[0], added=added, removed=removed, reused=False)
+
+    def page(self, name, fromfile, tofile, fromlines, tolines, opcodes):
+        """return the html page of a diff"""
+        import html
+        fmt, note = self.fmt, ''
+        if fmt in ('html', 'ndiff') and any((i2 - i1) * (j2 - j1) > self.html_max_replace
+                                             for tag, i1, i2, j1, j2 in opcodes if tag == 'replace'):
+            fmt, note = 'unified', f'<p>changes too large for a {self.fmt} diff, shown as unified diff</p>\n'
+        if fmt == 'html':
+            from difflib import HtmlDiff
+            body = HtmlDiff().make_table(fromlines, tolines, html.escape(fromfile), html.escape(tofile),
+                                         context=True, numlines=self.lines)
+        else:
+            if fmt == 'ndiff':
+                import difflib
+                diff_lines = difflib.ndiff(fromlines, tolines)
+            else:
+                format_diff = unified_diff if fmt == 'unified' else context_diff
+                diff_lines = format_diff(fromlines, tolines, group_opcodes(opcodes, self.lines),
+                                         fromfile, tofile, file_mtime(fromfile), file_mtime(tofile))
+            spans = list()
+            for i, line in enumerate(diff_lines):
+                cls = 'hunk' if i < 2 and fmt != 'ndiff' else self.line_classes.get(line[:1])  ## file headers
+                line = html.escape(line.rstrip('\n'))
+                spans.append(f'<span class="{cls}">{line}</span>' if cls else f'<span>{line}</span>')
+            body = note + '<pre>\n' + '\n'.join(spans) + '\n</pre>'
+        body = f'<p><a href="../index.html">index</a></p>\n<h3>{html.escape(name)}</h3>\n{body}'
+        return _report_page.format(title=html.escape(name), root='../', body=body)
+
+    def save(self, entries):
+        """write index.html, diff.css, diff.js and manifest.json of entries, remove the pages not in entries"""
+        import html, json
+        for filename, text in (('diff.css', report_css), ('diff.js', report_js)):
+            with open(os.path.join(self.report_dir, filename), 'w') as fh:
+                fh.write(text)
+
+        rows = list()
+        for entry in entries:
+            rows.append('<tr><td><a href="{page}">{name}</a></td><td>{tofile}</td><td class="num">{size1}</td>'
+                        '<td class="num">{size2}</td><td class="num">{added}</td><td class="num">{removed}</td></tr>'
+                        .format(page=html.escape(entry['page']), name=html.escape(entry['name']), tofile=html.escape(entry['tofile']),
+                                size1=entry['size1'], size2=entry['size2'], added=entry['added'], removed=entry['removed']))
+        reused = sum(1 for entry in entries if entry.get('reused'))
+        added, removed = sum(entry['added'] for entry in entries), sum(entry['removed'] for entry in entries)
+        columns = ('file', 'dir2 file', 'size1', 'size2', 'lines added', 'lines removed')
+        body = (f'<h3>{len(entries)} different files, {added} lines added, {removed} lines removed</h3>\n'
+                '<p><input id="filter" placeholder="filter" oninput="filterIndex(this.value)"></p>\n'
+                '<table class="index"><thead><tr>' + ''.join(f'<th onclick="sortIndex(this)">{col}</th>' for col in columns)
+                + '</tr></thead>\n<tbody>\n' + '\n'.join(rows) + '\n</tbody></table>')
+        with open(os.path.join(self.report_dir, 'index.html'), 'w') as fh:
+            fh.write(_report_page.format(title='diff report', root='', body=body))
+
+        pages = {entry['page'] for entry in entries}
+        for filename in os.listdir(os.path.join(self.report_dir, 'pages')):
+            if f'pages/{filename}' not in pages:
+                os.remove(os.path.join(self.report_dir, 'pages', filename))
+        manifest = {entry['name']: {k: v for k, v in entry.items() if k != 'reused'} for entry in entries}
+        with open(os.path.join(self.report_dir, 'manifest.json'), 'w') as fh:
+            json.dump(dict(options=self.options, entries=manifest), fh)
+        if self.log:
+            self.log.info(f'diff report: {os.path.join(self.report_dir, "index.html")}, pages: {len(entries)}, reused: {reused}')
+
+
 def diff(args, log=None):
-    print(f'args: {args}')
+    if log:
+        log.debug(f'args: {args}')
+    else:
+        print(f'args: {args}')
     lines = getattr(args, 'lines')
     maxdiff = getattr(args, 'maxdiff')
     context = getattr(args, 'context')
     fromfile = getattr(args, 'fromfile')
     tofile = getattr(args, 'tofile')
 
+    if files_identical(fromfile, tofile):
+        if log:
+            log.debug(f'{fromfile} and {tofile} are identical')
+        return
+
     fromdate = file_mtime(fromfile)
     todate = file_mtime(tofile)
+    ndiff = getattr(args, 'ndiff', False)
+    html = getattr(args, 'html', False)
+    if getattr(args, 'stream', False) and not (ndiff or html):
+        diff_lines = stream_diff(fromfile, tofile, fromdate, todate, n=lines,
+                                 window=getattr(args, 'window', default_window), unified=getattr(args, 'unified', False))
+        _output(diff_lines, maxdiff, log)
+        return
+
     with open(fromfile) as ff:
         fromlines = ff.readlines()
     with open(tofile) as tf:
         tolines = tf.readlines()
 
-    if hasattr(args, 'unified') and args.unified:
-        diff_lines = difflib.unified_diff(fromlines, tolines, fromfile, tofile, fromdate, todate, n=lines)
-    elif hasattr(args, 'ndiff') and args.ndiff:
+    opcodes = None
+    if not (ndiff or html) or getattr(args, 'check', False):
+        if getattr(args, 'algorithm', default_algorithm) == 'myers':
+            opcodes = trimmed_opcodes(fromlines, tolines, myers_opcodes)
+        else:
+            import difflib
+            opcodes = trimmed_opcodes(fromlines, tolines, lambda a, b: difflib.SequenceMatcher(None, a, b).get_opcodes())
+    if getattr(args, 'check', False):
+        check_diff(fromlines, tolines, opcodes, n=lines)
+
+    if ndiff:
+        import difflib
         diff_lines = difflib.ndiff(fromlines, tolines)
-    elif hasattr(args, 'html') and args.html:
-        diff_lines = difflib.HtmlDiff().make_file(fromlines, tolines, fromfile, tofile, context=context, numlines=lines)
+    elif html:
+        from difflib import HtmlDiff
+        ## a single html page, truncating it to --maxdiff lines would break it
+        diff_lines = iter([HtmlDiff().make_file(fromlines, tolines, fromfile, tofile, context=context, numlines=lines)])
+        maxdiff = 0
+    elif getattr(args, 'unified', False):
+        diff_lines = unified_diff(fromlines, tolines, group_opcodes(opcodes, lines), fromfile, tofile, fromdate, todate)
     else:
-        diff_lines = difflib.context_diff(fromlines, tolines, fromfile, tofile, fromdate, todate, n=lines)
+        diff_lines = context_diff(fromlines, tolines, group_opcodes(opcodes, lines), fromfile, tofile, fromdate, todate)
+    _output(diff_lines, maxdiff, log)
+
 
-    
+def _output(diff_lines, maxdiff, log=None):
     diff_out = None
     if maxdiff:
         # grab the first {maxdiff} elements from generator
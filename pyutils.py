@@ -1,5 +1,13 @@
+from __future__ import annotations  ## annotations are not evaluated so typing is never imported at startup
 import time
-from typing import Iterable
+
+
+def __getattr__(name):
+    """PEP 562: typing names are imported on first access only"""
+    if name in ('Iterable', 'Iterator'):
+        import typing
+        return getattr(typing, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def python_info(path=False):
@@ -11,24 +19,177 @@ def python_info(path=False):
         print(f"Python path: {sys.path}")
 
 
+class ElementMatcher:
+    """
+    Set-backed form of a collection of elements, build once and reuse for
+    contains_any, contains_all and remove_any on many sequences.
+    Unhashable elements are kept in a list and compared by equality.
+    """
+
+    def __init__(self, elements):
+        self.elements = set()
+        self.unhashable = list()
+        self.counts = dict()  # element => # of occurrences for remove()
+        for el in elements:
+            try:
+                self.elements.add(el)
+                self.counts[el] = self.counts.get(el, 0) + 1
+            except TypeError:
+                self.unhashable.append(el)
+
+    @staticmethod
+    def _has_lookup(seq) -> bool:
+        """True when seq tests membership without a scan, so elements are looked up in seq instead"""
+        from collections.abc import Mapping, Set
+
+        return isinstance(seq, (Set, Mapping, range))
+
+    def any(self, seq) -> bool:
+        """True when any element is in seq"""
+        if self._has_lookup(seq):
+            # unhashable elements can not be in a set or mapping, nor equal an int of a range
+            return any(el in seq for el in self.elements)
+        for el in seq:
+            try:
+                if el in self.elements:
+                    return True
+            except TypeError:
+                if el in self.unhashable:
+                    return True
+        return False
+
+    def all(self, seq) -> bool:
+        """True when every element is in seq"""
+        if self._has_lookup(seq):
+            return not self.unhashable and all(el in seq for el in self.elements)
+        try:
+            if not self.elements.issubset(seq):
+                return False
+        except TypeError:  # unhashable items in seq
+            if not all(el in seq for el in self.elements):
+                return False
+        return all(el in seq for el in self.unhashable)
+
+    def remove(self, seq):
+        """remove the first occurrence of each element from list seq in place, in a single pass"""
+        counts = dict(self.counts)
+        unhashable = list(self.unhashable)
+        kept = list()
+        for el in seq:
+            try:
+                count = counts.get(el, 0)
+                if count:
+                    counts[el] = count - 1
+                    continue
+            except TypeError:
+                if el in unhashable:
+                    unhashable.remove(el)
+                    continue
+            kept.append(el)
+        seq[:] = kept
+
+
+class SubstringMatcher:
+    """
+    Multi-pattern substring matcher of str or bytes, build once and reuse on many strings.
+    Up to {automaton_min} - 1 patterns are searched with str.find, which is faster in CPython,
+    more patterns are searched in a single pass with an Aho-Corasick automaton.
+    """
+
+    automaton_min = 50
+
+    def __init__(self, patterns):
+        import collections
+
+        # dedup and keep order, bytearray patterns are unhashable
+        self.patterns = list(
+            dict.fromkeys(bytes(x) if isinstance(x, bytearray) else x for x in patterns)
+        )
+        self.use_automaton = len(self.patterns) >= self.automaton_min
+        if not self.use_automaton:
+            return
+        # goto: trie of the patterns, out: bitmask of the patterns ending at a state
+        goto = [dict()]
+        out = [0]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    goto.append(dict())
+                    out.append(0)
+                    nxt = len(goto) - 1
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state] |= 1 << pid
+        # fail: longest proper suffix state, built breadth first
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] |= out[fail[nxt]]
+        self.goto, self.fail, self.out = goto, fail, out
+        self.all_mask = (1 << len(self.patterns)) - 1
+        self.empty = "" in self.patterns
+
+    def _scan(self, text, stop_mask):
+        """return the bitmask of the patterns found in text, stop once it covers stop_mask"""
+        goto, fail, out = self.goto, self.fail, self.out
+        found = out[0]  # empty pattern
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+                if found & stop_mask == stop_mask:
+                    break
+        return found
+
+    def any(self, text) -> bool:
+        """True when any pattern is a substring of text"""
+        if not self.use_automaton:
+            return any(pattern in text for pattern in self.patterns)
+        return self.empty or bool(self._scan(text, 0))
+
+    def all(self, text) -> bool:
+        """True when every pattern is a substring of text"""
+        if not self.use_automaton:
+            return all(pattern in text for pattern in self.patterns)
+        return self._scan(text, self.all_mask) == self.all_mask
+
+
 def contains_any(seq, subseq):
-    for c in subseq:
-        if c in seq:
-            return True
-    return False
+    """subseq can be a prebuilt ElementMatcher or SubstringMatcher"""
+    if isinstance(subseq, (ElementMatcher, SubstringMatcher)):
+        return subseq.any(seq)
+    if isinstance(seq, (str, bytes, bytearray)):
+        return SubstringMatcher(subseq).any(seq)
+    return ElementMatcher(subseq).any(seq)
 
 
 def contains_all(seq, subseq):
-    for c in subseq:
-        if c not in seq:
-            return False
-    return True
+    """subseq can be a prebuilt ElementMatcher or SubstringMatcher"""
+    if isinstance(subseq, (ElementMatcher, SubstringMatcher)):
+        return subseq.all(seq)
+    if isinstance(seq, (str, bytes, bytearray)):
+        return SubstringMatcher(subseq).all(seq)
+    return ElementMatcher(subseq).all(seq)
 
 
 def remove_any(seq, subseq):
-    for c in subseq:
-        if c in seq:
-            seq.remove(c)
+    """remove the first occurrence of each item of subseq from list seq in place,
+    subseq can be a prebuilt ElementMatcher"""
+    if not isinstance(subseq, ElementMatcher):
+        subseq = ElementMatcher(subseq)
+    subseq.remove(seq)
 
 
 def replace_prefix(prefix, to, text):
@@ -68,9 +229,11 @@ def remove_suffix(suffix, text, strip=True):
 # add suffix to str or iterable and return the result
 # type hints | added in Python 3.10+
 def add_suffix(suffix: str, seq: str | Iterable[str]) -> str | list:
+    from collections.abc import Iterable
+
     if isinstance(seq, str):
         return seq + suffix
-    elif isinstance(seq, Iterable[str]):
+    elif isinstance(seq, Iterable):
         return [x + suffix for x in seq]
     else:
         raise TypeError("Invalid Type for inp, expected: list or str!")
@@ -122,7 +285,7 @@ def time_diff_hms(start_time: time, end_time=None) -> str:
 
 def time_diff_ns(start_time: int, end_time=None) -> str:
     """convert time_diff in nanoseconds to seconds::milliseconds::microseconds::nanoseconds format"""
-    if not end_time:  # use current time as end time by default
+    if end_time is None:  # use current time as end time by default
         end_time = time.time_ns()
     duration = end_time - start_time
     seconds, remainder = divmod(duration, pow(10, 9))
@@ -142,11 +305,304 @@ def time_diff_ns(start_time: int, end_time=None) -> str:
         return f"{milliseconds}ms::{microseconds}us::{nanoseconds}ns"
 
 
+class _Timer:
+    """context manager recording the elapsed nanoseconds of its block into a Profiler"""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Profiler:
+    """
+    Record nanosecond timings of hot paths into named histograms, plus named counters.
+        enabled: Optional, timers of a disabled profiler do nothing
+        cprofile: Optional capture cProfile stats between start() and stop()
+        tracemalloc: Optional capture memory allocation stats between start() and stop()
+    Usage:
+        prof = Profiler()
+        with prof.timer("compare"):
+            ...
+        @prof.timed("lookup")
+        def lookup(name): ...
+        prof.count("files")
+        print(prof.report())
+    """
+
+    def __init__(self, enabled=True, cprofile=False, tracemalloc=False):
+        import threading
+
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+        self.timings = dict()  # name => list of durations in ns
+        self.counters = dict()
+        self.lock = threading.Lock()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self._cprofile = None
+        self._snapshot = None
+
+    def timer(self, name):
+        """context manager timing its block into histogram {name}"""
+        if not self.enabled:
+            from contextlib import nullcontext
+
+            return nullcontext()
+        return _Timer(self, name)
+
+    def timed(self, name=None):
+        """decorator timing every call of a function into histogram {name}, default: function name"""
+        from functools import wraps
+
+        def decorator(func):
+            timer_name = name or func.__qualname__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(timer_name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def iter(self, name, items):
+        """yield from items timing every next() into histogram {name}, to time lazy generators"""
+        items = iter(items)
+        while True:
+            with self.timer(name):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+    def record(self, name, duration_ns):
+        """add a duration in nanoseconds to histogram {name}"""
+        if self.enabled:
+            with self.lock:
+                self.timings.setdefault(name, []).append(duration_ns)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def start(self):
+        """reset the wall clock and start the opt-in cProfile/tracemalloc captures"""
+        self.start_ns = time.perf_counter_ns()
+        if self.cprofile:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        if self.tracemalloc:
+            import tracemalloc
+
+            tracemalloc.start()
+
+    def stop(self):
+        self.end_ns = time.perf_counter_ns()
+        if self._cprofile:
+            self._cprofile.disable()
+        if self.tracemalloc:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                self._snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+
+    def stats(self, name) -> dict:
+        """return count, total, p50, p95, p99 and max in ns of histogram {name}"""
+        durations = sorted(self.timings.get(name, []))
+        if not durations:
+            return dict(count=0, total=0, p50=0, p95=0, p99=0, max=0)
+
+        def percentile(p):
+            return durations[min(len(durations) - 1, int(len(durations) * p / 100))]
+
+        return dict(
+            count=len(durations),
+            total=sum(durations),
+            p50=percentile(50),
+            p95=percentile(95),
+            p99=percentile(99),
+            max=durations[-1],
+        )
+
+    def to_dict(self) -> dict:
+        """wall time, histogram stats and counters, durations in ns"""
+        end_ns = self.end_ns or time.perf_counter_ns()
+        return dict(
+            wall=end_ns - self.start_ns,
+            timers={name: self.stats(name) for name in self.timings},
+            counters=dict(self.counters),
+        )
+
+    def report(self, top=10) -> str:
+        """return the timings report, with the top cProfile and tracemalloc entries when captured"""
+        data = self.to_dict()
+        wall = data["wall"]
+        if wall >= 60 * pow(10, 9):
+            lines = [f"profile wall time: {time_hms(wall / pow(10, 9))}"]
+        else:
+            lines = [f"profile wall time: {time_diff_ns(0, wall)}"]
+        for name, st in data["timers"].items():
+            fields = ", ".join(
+                f"{key}: {time_diff_ns(0, st[key])}"
+                for key in ("total", "p50", "p95", "p99", "max")
+            )
+            lines.append(f"  {name}: count: {st['count']}, {fields}")
+        for name, value in data["counters"].items():
+            lines.append(f"  {name}: {value}")
+        if self._cprofile:
+            import io
+            import pstats
+
+            out = io.StringIO()
+            pstats.Stats(self._cprofile, stream=out).sort_stats("cumulative").print_stats(top)
+            lines.append(out.getvalue())
+        if self._snapshot:
+            lines.append(f"  top {top} memory allocations:")
+            for stat in self._snapshot.statistics("lineno")[:top]:
+                lines.append(f"    {stat}")
+        return "\n".join(lines)
+
+
 """
 Function to get average of a list: use mean() function from statistics module.
 """
 
 
+def _queue_logging(name, handlers, queue_size, overflow, batch_size, flush_interval):
+    """return (QueueHandler, listener) that moves the blocking writes of handlers to a background thread.
+    The listener drains up to batch_size records per wakeup and flushes the handlers once per batch,
+    it waits flush_interval seconds after a partial batch.
+    Stopping the listener logs a warning with the # of records dropped by a full queue and closes the handlers.
+    """
+    import logging
+    import logging.handlers
+    import queue
+    import threading
+
+    class DeferredFlushMixin:
+        def flush(self):
+            pass  # emit() flushes after every record, the listener flushes once per batch
+
+        def flush_batch(self):
+            super().flush()
+
+    class BoundedQueueHandler(logging.handlers.QueueHandler):
+        def __init__(self, log_queue):
+            super().__init__(log_queue)
+            self.dropped = 0
+
+        def prepare(self, record):
+            # merge args into msg now in case they are mutated later, the record is not copied
+            # since it is not pickled, other handlers still format the same message from it
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+
+        def enqueue(self, record):
+            if overflow == "block":
+                self.queue.put(record)
+                return
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                if overflow == "drop_oldest":
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+                    try:
+                        self.queue.put_nowait(record)
+                        return
+                    except queue.Full:
+                        pass
+                self.dropped += 1
+
+    class BatchListener:
+        _stop = object()
+
+        def __init__(self, log_queue, handlers, queue_handler):
+            self.queue = log_queue
+            self.handlers = handlers
+            self.queue_handler = queue_handler
+            self.thread = None
+
+        def start(self):
+            self.thread = threading.Thread(target=self._run, name="init_logger", daemon=True)
+            self.thread.start()
+
+        def _run(self):
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = False
+                for record in batch:
+                    if record is self._stop:
+                        stop = True
+                        continue
+                    for handler in self.handlers:
+                        if record.levelno >= handler.level:
+                            handler.handle(record)
+                for handler in self.handlers:
+                    handler.flush_batch()
+                if stop:
+                    return
+                if len(batch) < batch_size:
+                    # let records accumulate instead of waking up for every record
+                    time.sleep(flush_interval)
+
+        def stop(self):
+            if self.thread:
+                self.queue.put(self._stop)  # always blocks so no record is lost at exit
+                self.thread.join()
+                self.thread = None
+                if self.queue_handler.dropped:
+                    record = logging.makeLogRecord(
+                        dict(
+                            name=name,
+                            levelno=logging.WARNING,
+                            levelname="WARNING",
+                            msg=f"log queue full, dropped {self.queue_handler.dropped} records",
+                        )
+                    )
+                    for handler in self.handlers:
+                        if record.levelno >= handler.level:
+                            handler.handle(record)
+                for handler in self.handlers:
+                    handler.flush_batch()
+                    handler.close()
+
+    # swap in the deferred flush classes of the handlers
+    for handler in handlers:
+        handler.__class__ = type(
+            handler.__class__.__name__, (DeferredFlushMixin, handler.__class__), {}
+        )
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = BoundedQueueHandler(log_queue)
+    return queue_handler, BatchListener(log_queue, handlers, queue_handler)
+
+
 def init_logger(
     name,
     script=None,
@@ -155,6 +611,11 @@ def init_logger(
     debug=False,
     log_level=None,
     console=True,
+    queue=False,
+    queue_size=10000,
+    overflow="block",
+    batch_size=256,
+    flush_interval=0.05,
 ):
     """
     Initialize logger and retun log object.
@@ -165,11 +626,21 @@ def init_logger(
         logdir: Optional logfile dir, Default: Current dir
         debug: Optional enable debug log level, Default: logging.INFO
         log_level: Optional explicit log level override
+        queue: Optional non-blocking mode, records are queued and written by a background thread
+        queue_size: Optional max # of queued records in non-blocking mode
+        overflow: Optional policy when the queue is full: block, drop (new record) or drop_oldest
+        batch_size: Optional max # of records written per handler flush in non-blocking mode
+        flush_interval: Optional max delay in seconds before queued records are written
+    Calling init_logger again for the same name replaces the handlers added by the earlier call.
     """
+    import atexit
     import logging
     import os
     from pathlib import Path
 
+    if overflow not in ("block", "drop", "drop_oldest"):
+        raise ValueError(f"Invalid overflow: {overflow}, expected: block, drop or drop_oldest")
+
     if not log_level:
         log_level = (
             logging.DEBUG if debug or os.getenv("DEBUG", False) else logging.INFO
@@ -178,6 +649,16 @@ def init_logger(
     log = logging.getLogger(name)
     log.setLevel(log_level)
 
+    # remove handlers of an earlier call so the records are not written twice
+    listener = getattr(log, "_init_logger_listener", None)
+    if listener:
+        listener.stop()  # also closes the handlers of the listener
+        atexit.unregister(listener.stop)
+        log._init_logger_listener = None
+    for handler in [x for x in log.handlers if getattr(x, "_init_logger", False)]:
+        log.removeHandler(handler)
+        handler.close()
+
     if not logfile and script:
         # if {script}.py file name is provided, use {script}.log as logfile
         script_path = Path(script)
@@ -191,23 +672,51 @@ def init_logger(
     formatter = logging.Formatter(
         "%(asctime)s: %(name)s: %(levelname)s: %(message)s", "%Y/%b/%d-%H:%M:%S"
     )
+    handlers = list()
     if console:  # create console handler for logger
         log_ch = logging.StreamHandler()
         log_ch.setFormatter(formatter)
         log_ch.setLevel(log_level)
-        log.addHandler(log_ch)
+        handlers.append(log_ch)
 
     if logfile:  # create file handler for logger
         log_fh = logging.FileHandler(filename=logfile, mode="w")
         log_fh.setFormatter(formatter)
         log_fh.setLevel(log_level)
-        log.addHandler(log_fh)
+        handlers.append(log_fh)
+
+    if queue:  # writes are moved to a background thread
+        queue_handler, listener = _queue_logging(
+            name, handlers, queue_size, overflow, batch_size, flush_interval
+        )
+        queue_handler.setLevel(log_level)
+        handlers = [queue_handler]
+        listener.start()
+        log._init_logger_listener = listener
+        atexit.register(listener.stop)
+
+    for handler in handlers:
+        handler._init_logger = True
+        log.addHandler(handler)
+
+    if logfile:
         log.info("log: {}, level: {}".format(logfile, logging.getLevelName(log_level)))
     else:
         log.info("log level: {}".format(logging.getLevelName(log_level)))
     return log
 
 
+def file_digest(filename, chunk_size=1 << 20) -> str:
+    """return blake2b hex digest of the file contents"""
+    import hashlib
+
+    h = hashlib.blake2b()
+    with open(filename, "rb") as fh:
+        while chunk := fh.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 def file_length(filename, max_lines=0):
     line_count = 0
     with open(filename) as fh:
@@ -230,7 +739,7 @@ def save_df2xlsx(df, writer, sheet_name, out_columns=None, wr_index=None):
     if not df.empty:  # write only if not empty
         if wr_index is None:
             wr_index = False
-            if isinstance(df.index, pd.core.index.MultiIndex):
+            if isinstance(df.index, pd.MultiIndex):
                 wr_index = True
         df_columns = list()
         if out_columns:
@@ -248,49 +757,155 @@ def save_df2xlsx(df, writer, sheet_name, out_columns=None, wr_index=None):
         )
 
 
+def xlsx_sheet_name(name):
+    """return a valid excel sheet name for name"""
+    # to workaround Exception: Invalid Excel character '[]:*?/\' in sheetname '{sheet_name}'
+    if "::" in name:
+        name = name.replace("::", ".")
+    # to workaround Exception: Excel worksheet name '{sheet_name}' must be <= 31 chars.
+    # use first 10 and last 20 chars when the length is longer
+    name_len = len(name)
+    if name_len > 31:
+        name = "{}-{}".format(name[:10], name[(name_len - 20):])
+    return name
+
+
+class XlsxWriter:
+    """
+    Context managed excel writer, the file is written and closed when the with block exits.
+        filename: excel file name
+        out_columns: Optional default columns to write, in order
+        wr_index: Optional default write index, Default: only for MultiIndex
+        engine_kwargs: Optional kwargs of the excel engine
+    Usage:
+        with XlsxWriter("out.xlsx") as writer:
+            writer.write(df, "sheet1")
+    """
+
+    def __init__(self, filename, out_columns=None, wr_index=None, engine=None, engine_kwargs=None):
+        self.filename = filename
+        self.out_columns = out_columns
+        self.wr_index = wr_index
+        self.engine = engine
+        self.engine_kwargs = engine_kwargs
+        self.writer = None
+
+    def __enter__(self):
+        import pandas as pd
+
+        self.writer = pd.ExcelWriter(
+            self.filename, engine=self.engine, engine_kwargs=self.engine_kwargs
+        )
+        return self
+
+    def write(self, df, sheet_name, out_columns=None, wr_index=None):
+        save_df2xlsx(
+            df,
+            self.writer,
+            xlsx_sheet_name(sheet_name),
+            out_columns or self.out_columns,
+            self.wr_index if wr_index is None else wr_index,
+        )
+
+    def __exit__(self, *exc):
+        self.writer.close()
+        self.writer = None
+        return False
+
+
 # save a dict of dfs to excel file with each df to a seperate sheet.
 def save_dict2xlsx(df_dict, filename, out_columns=None, wr_index=None):
-    import pandas as pd
-
-    writer = pd.ExcelWriter(filename)
-    for ii, key in enumerate(df_dict.keys()):
-        df = df_dict[key]
-        sheet_name = key
-        # to workaround Exception: Invalid Excel character '[]:*?/\' in sheetname '{sheet_name}'
-        if "::" in sheet_name:
-            sheet_name = sheet_name.replace("::", ".")
-
-        # to workaround Exception: Excel worksheet name '{sheet_name}' must be <= 31 chars.
-        # use first 10 and last 20 chars when the length is longer
-        sname_len = len(sheet_name)
-        if sname_len > 31:
-            sheet_name = "{}-{}".format(sheet_name[:10], sheet_name[(sname_len - 20):])
-        # drop the columns that do not exist in df
-        # df_columns = list(set(out_columns) & set(df.columns))
-        # use for loop to retain the order of columns
-        save_df2xlsx(df, writer, sheet_name, out_columns, wr_index)
+    with XlsxWriter(filename, out_columns, wr_index) as writer:
+        for sheet_name, df in df_dict.items():
+            writer.write(df, sheet_name)
 
 
 # save a list of dfs to excel file with each df to a seperate sheet.
 def save_list2xlsx(df_list, filename, out_columns=None, wr_index=None):
+    with XlsxWriter(filename, out_columns, wr_index) as writer:
+        for i, df in enumerate(df_list):
+            writer.write(df, "sheet{}".format(i))
+
+
+def _parse_sheet(filename, sheet_name):
     import pandas as pd
 
-    writer = pd.ExcelWriter(filename)
-    for i, df in enumerate(df_list):
-        sheet_name = "sheet{}".format(i)
-        save_df2xlsx(df, writer, sheet_name, out_columns, wr_index)
+    return pd.read_excel(filename, sheet_name=sheet_name)
+
+
+def _xlsx_cache(filename):
+    """return (cache dir, manifest) of the parquet sidecar of an excel file,
+    the manifest is reset when the file size or mtime changed
+    """
+    import json
+    import os
+    from pathlib import Path
+
+    path = Path(filename)
+    cache_dir = path.with_name(f".{path.name}.cache")
+    st = os.stat(filename)
+    key = dict(size=st.st_size, mtime_ns=st.st_mtime_ns, sheets=dict())
+    try:
+        with open(cache_dir / "manifest.json") as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        manifest = None
+    if not manifest or (manifest["size"], manifest["mtime_ns"]) != (key["size"], key["mtime_ns"]):
+        manifest = key
+    return cache_dir, manifest
 
 
 # load a dict of dfs from excel file with each df from a seperate sheet.
-def load_xlsx2dict(filename):
+def load_xlsx2dict(filename, sheets=None, columns=None, jobs=1, cache=False):
+    """
+    Load excel sheets into a dict of sheet name => df.
+        sheets: Optional list of sheet names to load, Default: all sheets
+        columns: Optional list of columns to load from every sheet
+        jobs: Optional # of processes parsing sheets in parallel
+        cache: Optional cache parsed sheets in parquet files next to the excel file,
+               reused while the excel file size and mtime are unchanged
+    """
+    import json
     import pandas as pd
 
-    xl = pd.ExcelFile(filename)
-    df_dict = dict()
-    for sheet_name in xl.sheet_names:
-        df_dict[sheet_name] = xl.parse(sheet_name)
+    sheet_names = pd.ExcelFile(filename).sheet_names
+    if sheets:
+        sheet_names = [x for x in sheet_names if x in sheets]
 
-    return df_dict
+    df_dict = dict()
+    cache_dir, manifest = _xlsx_cache(filename) if cache else (None, None)
+    if cache:
+        for sheet_name in sheet_names:
+            parquet = manifest["sheets"].get(sheet_name)
+            if parquet and (cache_dir / parquet).exists():
+                df_dict[sheet_name] = pd.read_parquet(cache_dir / parquet)
+
+    # sheets are parsed whole so cached ones serve any columns, columns are selected below
+    to_parse = [x for x in sheet_names if x not in df_dict]
+    if jobs > 1 and len(to_parse) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(to_parse))) as pool:
+            futures = {x: pool.submit(_parse_sheet, filename, x) for x in to_parse}
+            parsed = {x: future.result() for x, future in futures.items()}
+    else:
+        parsed = {x: _parse_sheet(filename, x) for x in to_parse}
+
+    if cache and parsed:
+        cache_dir.mkdir(exist_ok=True)
+        for i, (sheet_name, df) in enumerate(parsed.items(), len(manifest["sheets"])):
+            parquet = f"sheet{i}.parquet"
+            try:
+                df.to_parquet(cache_dir / parquet)
+            except (ValueError, TypeError, ImportError):
+                continue  # columns parquet can not store are not cached
+            manifest["sheets"][sheet_name] = parquet
+        with open(cache_dir / "manifest.json", "w") as fh:
+            json.dump(manifest, fh)
+    df_dict.update(parsed)
+    if columns:
+        df_dict = {x: df[[c for c in columns if c in df.columns]] for x, df in df_dict.items()}
+    return {x: df_dict[x] for x in sheet_names}  # retain the sheet order
 
 
 # load config yaml file and update args
@@ -332,29 +947,62 @@ def parse_config(args, config_file="config.yaml", config_attr="config_file"):
     return args
 
 
+def iflatten(seq, max_depth=None, uniquify=False) -> Iterator:
+    """iflatten(sequence) -> iterator
+
+    Lazily yields all elements retrieved from the sequence and all recursively
+    contained sub-sequences (iterables), except str, bytes and bytearray. Nesting is walked
+    with an explicit stack so deep inputs do not hit the recursion limit.
+        max_depth: Optional max # of nesting levels to flatten, deeper iterables are yielded as is
+        uniquify: Optional skip repeated elements, the first occurrence order is kept.
+                  unhashable elements are compared by equality
+
+    Examples:
+    >>> list(iflatten([[[1,2,3], (42,None)], [4,5], [6], 7, range(8,11)]))
+    [1, 2, 3, 42, None, 4, 5, 6, 7, 8, 9, 10]
+    >>> list(iflatten([1, [2, [3, [4]]]], max_depth=2))
+    [1, 2, 3, [4]]
+    >>> list(iflatten([3, [1, 3], [[1], bytearray(b'a'), bytearray(b'a')]], uniquify=True))
+    [3, 1, bytearray(b'a')]"""
+
+    seen = set()
+    seen_unhashable = list()
+    stack = [iter(seq)]
+    while stack:
+        for el in stack[-1]:
+            if (
+                hasattr(el, "__iter__")
+                and not isinstance(el, (str, bytes, bytearray))
+                and (max_depth is None or len(stack) <= max_depth)
+            ):
+                stack.append(iter(el))
+                break  # descend first, resume the parent iterator afterwards
+            if uniquify:
+                try:
+                    if el in seen:
+                        continue
+                    seen.add(el)
+                except TypeError:  # unhashable
+                    if el in seen_unhashable:
+                        continue
+                    seen_unhashable.append(el)
+            yield el
+        else:
+            stack.pop()
+
+
 def flatten(seq, uniquify=True) -> list:
     """flatten(sequence) -> list
 
     Returns a single, flat list which contains all elements retrieved
     from the sequence and all recursively contained sub-sequences
-    (iterables).
+    (iterables), see iflatten().
 
     Examples:
-    >>> [1, 2, [3,4], (5,6)]
-    [1, 2, [3, 4], (5, 6)]
-    >>> flatten([[[1,2,3], (42,None)], [4,5], [6], 7, MyVector(8,9,10)])
+    >>> flatten([[[1,2,3], (42,None)], [4,5], [6], 7, range(8,11)])
     [1, 2, 3, 42, None, 4, 5, 6, 7, 8, 9, 10]"""
 
-    result = []
-    for el in seq:
-        # if isinstance(el, (list, tuple)):
-        if hasattr(el, "__iter__") and not isinstance(el, str):
-            result.extend(flatten(el))
-        else:
-            result.append(el)
-    if uniquify:
-        result = list(set(result))
-    return result
+    return list(iflatten(seq, uniquify=uniquify))
 
 
 # prompt yes or no question to user